@@ -0,0 +1,101 @@
+"""
+Deletion of accounts.
+
+A user asking to delete the account is deactivated at once: inactive
+users can't log in and their profile, posts and comments are hidden.
+The delete_accounts command then removes their content stage by stage,
+in batches of ACCOUNT_DELETION_BATCH_SIZE rows, each batch in its own
+short transaction, and finally the user row itself. Django's cascade
+never has to collect a whole account in memory and SQLite is never
+locked for long. AccountDeletion records the progress, so an
+interrupted run continues where it stopped.
+
+Images are released through the post_delete signals, see
+posts/stored_files.py.
+"""
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .feeds import bump_feed_versions, post_scopes
+from .likes import bump_counter
+from .models import (AccountDeletion, ArchivedComment, ArchivedMention,
+                     ArchivedPost, Comment, Follow, Like, Mention,
+                     Notification, Post, Signature, User)
+from .utils import pk_batches
+
+
+def delete_likes(queryset):
+    """Likes of other authors' posts also leave their counters"""
+    with transaction.atomic():
+        for post_id in queryset.values_list("post_id", flat=True):
+            bump_counter(post_id, -1)
+        return queryset.delete()[0]
+
+
+STAGES = (
+    ("comments", lambda uid: Comment.objects.filter(
+        Q(author_id=uid) | Q(post__author_id=uid))),
+    ("archived_comments", lambda uid: ArchivedComment.objects.filter(
+        Q(author_id=uid) | Q(post__author_id=uid))),
+    ("notifications", lambda uid: Notification.objects.filter(
+        Q(recipient_id=uid) | Q(actor_id=uid) | Q(post__author_id=uid))),
+    ("likes", lambda uid: Like.objects.filter(user_id=uid)
+     .exclude(post__author_id=uid)),
+    ("received_likes", lambda uid: Like.objects.filter(post__author_id=uid)),
+    ("mentions", lambda uid: Mention.objects.filter(
+        Q(user_id=uid) | Q(post__author_id=uid))),
+    ("archived_mentions", lambda uid: ArchivedMention.objects.filter(
+        Q(user_id=uid) | Q(post__author_id=uid))),
+    ("posts", lambda uid: Post.objects.filter(author_id=uid)),
+    ("archived_posts", lambda uid: ArchivedPost.objects.filter(
+        author_id=uid)),
+    ("follows", lambda uid: Follow.objects.filter(
+        Q(user_id=uid) | Q(author_id=uid))),
+    ("signatures", lambda uid: Signature.objects.filter(author_id=uid)),
+)
+
+
+def request_deletion(user):
+    """Hide the user now, the content goes with delete_accounts"""
+    with transaction.atomic():
+        user.is_active = False
+        user.save(update_fields=["is_active"])
+        AccountDeletion.objects.get_or_create(
+            user_id=user.pk, defaults={"username": user.username})
+    group_ids = (Post.objects.filter(author=user, group__isnull=False)
+                 .order_by().values_list("group_id", flat=True).distinct())
+    bump_feed_versions(post_scopes(user.pk, group_ids))
+
+
+def process(deletion, batch_size=None, pause=0):
+    """Delete everything of the user, returns the number of rows"""
+    batch_size = batch_size or settings.ACCOUNT_DELETION_BATCH_SIZE
+    names = [name for name, _ in STAGES]
+    start = names.index(deletion.stage) if deletion.stage in names else 0
+    for name, queryset in STAGES[start:]:
+        deletion.stage = name
+        deletion.save(update_fields=["stage"])
+        model = queryset(deletion.user_id).model
+        for batch in pk_batches(queryset(deletion.user_id), batch_size):
+            batch = model.objects.filter(pk__in=batch)
+            with transaction.atomic():
+                if name == "likes":
+                    deleted = delete_likes(batch)
+                else:
+                    deleted = batch.delete()[0]
+                AccountDeletion.objects.filter(pk=deletion.pk).update(
+                    deleted=F("deleted") + deleted)
+            deletion.deleted += deleted
+            if pause:
+                time.sleep(pause)
+    with transaction.atomic():
+        deleted = User.objects.filter(pk=deletion.user_id).delete()[0]
+        deletion.deleted += deleted
+        deletion.stage = "done"
+        deletion.finished = timezone.now()
+        deletion.save(update_fields=["deleted", "stage", "finished"])
+    return deletion.deleted
@@ -1,13 +1,134 @@
+from django.conf import settings
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.utils.functional import cached_property
 
-from .models import Group, Post, Follow, Comment
+from . import group_stats, object_cache
+from .feeds import bump_feed_versions
+from .models import Group, Post, Follow, Comment, SpamFlag
+from .utils import pk_batches
 
 
-class PostAdmin(admin.ModelAdmin):
+def estimated_count(model):
+    """Cheap row count estimate without scanning the table"""
+    table = connection.ops.quote_name(model._meta.db_table)
+    pk = connection.ops.quote_name(model._meta.pk.column)
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("SELECT reltuples::bigint FROM pg_class "
+                           "WHERE relname = %s", [model._meta.db_table])
+        else:
+            cursor.execute(f"SELECT MAX({pk}) FROM {table}")
+        row = cursor.fetchone()
+    return int(row[0] or 0) if row else 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Unfiltered changelists of big tables show an estimated number of
+    rows instead of running an exact COUNT(*).
+    """
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, "query", None)
+        if query is not None and not query.where:
+            estimate = estimated_count(self.object_list.model)
+            if estimate > settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+class UsernameFilter(admin.SimpleListFilter):
+    """Text input instead of a list of every user in the sidebar"""
+    template = "admin/input_filter.html"
+    field = None
+
+    def lookups(self, request, model_admin):
+        # must not be empty, otherwise the filter is hidden
+        return ((None, None),)
+
+    def choices(self, changelist):
+        all_choice = next(super().choices(changelist))
+        all_choice["query_parts"] = (
+            (name, value)
+            for name, value in changelist.get_filters_params().items()
+            if name != self.parameter_name
+        )
+        yield all_choice
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(
+                **{f"{self.field}__username": self.value()})
+
+
+class AuthorFilter(UsernameFilter):
+    title = "автор"
+    parameter_name = "author"
+    field = "author"
+
+
+class UserFilter(UsernameFilter):
+    title = "подписчик"
+    parameter_name = "user"
+    field = "user"
+
+
+class BatchedAdmin(admin.ModelAdmin):
+    """
+    Changelist and actions usable on tables with millions of rows:
+    no exact counts, deletes and updates in small committed batches.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ("delete_in_batches",)
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        # the stock action loads every selected object into memory
+        actions.pop("delete_selected", None)
+        return actions
+
+    def in_batches(self, queryset, operation):
+        done = 0
+        for batch in pk_batches(queryset, settings.ADMIN_BATCH_SIZE):
+            with transaction.atomic():
+                done += operation(self.model.objects.filter(pk__in=batch))
+            # bulk updates do not send signals
+            object_cache.invalidate(self.model, batch)
+        return done
+
+    def delete_in_batches(self, request, queryset):
+        deleted = self.in_batches(queryset, lambda qs: qs.delete()[0])
+        self.message_user(request, f"Удалено объектов: {deleted}")
+    delete_in_batches.short_description = "Удалить выбранные (пакетами)"
+
+
+class PostAdmin(BatchedAdmin):
     list_display = ('pk', 'text', 'text', 'pub_date', 'author', 'group')
+    list_select_related = ('author', 'group')
+    autocomplete_fields = ('author', 'group')
     search_fields = ('text',)
-    list_filter = ('pub_date',)
+    list_filter = ('pub_date', AuthorFilter)
     empty_value_display = '-пусто-'
+    actions = BatchedAdmin.actions + ("remove_from_group",)
+
+    def remove_from_group(self, request, queryset):
+        updated = self.in_batches(queryset, self.ungroup)
+        self.message_user(request, f"Убрано из сообществ: {updated}")
+    remove_from_group.short_description = "Убрать из сообщества"
+
+    @staticmethod
+    def ungroup(posts):
+        group_ids = set(posts.exclude(group=None).order_by()
+                        .values_list("group_id", flat=True))
+        updated = posts.update(group=None)
+        # no post_save: redo what the signals do for the touched groups
+        for group_id in group_ids:
+            group_stats.rebuild(group_id)
+        bump_feed_versions(f"group:{group_id}" for group_id in group_ids)
+        return updated
 
 
 class GroupAdmin(admin.ModelAdmin):
@@ -17,21 +138,39 @@ class GroupAdmin(admin.ModelAdmin):
     empty_value_display = '-пусто-'
 
 
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(BatchedAdmin):
     list_display = ('pk', 'user', 'author')
-    search_fields = ('user',)
-    list_filter = ('author', 'user',)
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
+    search_fields = ('user__username',)
+    list_filter = (AuthorFilter, UserFilter)
     empty_value_display = '-пусто-'
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(BatchedAdmin):
     list_display = ('pk', 'author', 'post', 'text', 'created')
-    search_fields = ('author', 'post', 'text')
-    list_filter = ('author', 'created', 'post')
+    list_select_related = ('author', 'post')
+    autocomplete_fields = ('author', 'post')
+    search_fields = ('author__username', 'text')
+    list_filter = (AuthorFilter, 'created')
     empty_value_display = '-пусто-'
 
 
+class SpamFlagAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'signature', 'duplicate_of', 'similarity',
+                    'same_author', 'created', 'resolved')
+    list_select_related = ('signature', 'duplicate_of')
+    list_filter = ('resolved', 'same_author')
+    actions = ("mark_resolved",)
+
+    def mark_resolved(self, request, queryset):
+        updated = queryset.update(resolved=True)
+        self.message_user(request, f"Проверено: {updated}")
+    mark_resolved.short_description = "Отметить как проверенные"
+
+
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group, GroupAdmin)
 admin.site.register(Follow, FollowAdmin)
 admin.site.register(Comment, CommentAdmin)
+admin.site.register(SpamFlag, SpamFlagAdmin)
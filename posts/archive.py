@@ -0,0 +1,137 @@
+"""
+Hot/cold split of posts.
+
+Posts older than ARCHIVE_AFTER_DAYS are moved with their comments into
+ArchivedPost/ArchivedComment by the archive_posts command, in small
+batches, each in its own transaction. Revisions, tags and mentions move
+to ArchivedPostRevision/ArchivedPostTag/ArchivedMention (with their
+image references), likes are frozen into
+ArchivedPost.likes_count. Notifications about the posts are past the
+compact_notifications retention and are dropped, with a log line.
+Views fall back to the archive for ids that are no longer in the hot
+table.
+"""
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils.functional import cached_property
+
+from .models import (ArchivedComment, ArchivedMention, ArchivedPost,
+                     ArchivedPostRevision, ArchivedPostTag, Comment,
+                     LikeCounter, Mention, Notification, Post, PostRevision,
+                     PostTag)
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+
+
+@contextmanager
+def archiving():
+    """Posts deleted inside are being archived, not removed"""
+    _state.active = True
+    try:
+        yield
+    finally:
+        _state.active = False
+
+
+def is_archiving():
+    return getattr(_state, "active", False)
+
+
+def archive_batch(post_ids):
+    """Move posts with their comments to the archive in one transaction"""
+    with transaction.atomic(), archiving():
+        # Locked first: new comments and likes of these posts wait for
+        # the commit (their foreign key check needs the row), so none
+        # is created between the copy and the delete.
+        posts = list(Post.objects.select_for_update()
+                     .filter(pk__in=post_ids))
+        post_ids = [post.pk for post in posts]
+        likes = dict(LikeCounter.objects.filter(post_id__in=post_ids)
+                     .values("post_id")
+                     .annotate(total=Sum("count"))
+                     .values_list("post_id", "total"))
+        ArchivedPost.objects.bulk_create(
+            ArchivedPost(id=post.pk,
+                         text=post.text,
+                         html=post.html,
+                         pub_date=post.pub_date,
+                         updated=post.updated,
+                         author_id=post.author_id,
+                         group_id=post.group_id,
+                         image=post.image.name,
+                         likes_count=max(likes.get(post.pk) or 0, 0),
+                         revision=post.revision)
+            for post in posts
+        )
+        ArchivedComment.objects.bulk_create(
+            ArchivedComment(id=comment.pk,
+                            post_id=comment.post_id,
+                            author_id=comment.author_id,
+                            text=comment.text,
+                            created=comment.created)
+            for comment in Comment.objects.filter(post_id__in=post_ids)
+        )
+        ArchivedPostRevision.objects.bulk_create(
+            ArchivedPostRevision(post_id=revision.post_id,
+                                 number=revision.number,
+                                 created=revision.created,
+                                 is_snapshot=revision.is_snapshot,
+                                 body=revision.body,
+                                 image=revision.image)
+            for revision in PostRevision.objects.filter(
+                post_id__in=post_ids)
+        )
+        ArchivedPostTag.objects.bulk_create(
+            ArchivedPostTag(tag_id=tag.tag_id,
+                            post_id=tag.post_id,
+                            pub_date=tag.pub_date)
+            for tag in PostTag.objects.filter(post_id__in=post_ids)
+        )
+        ArchivedMention.objects.bulk_create(
+            ArchivedMention(user_id=mention.user_id,
+                            post_id=mention.post_id,
+                            pub_date=mention.pub_date)
+            for mention in Mention.objects.filter(post_id__in=post_ids)
+        )
+        notifications = Notification.objects.filter(
+            post_id__in=post_ids).count()
+        if notifications:
+            logger.info("Archiving %d posts drops %d notifications",
+                        len(post_ids), notifications)
+        Post.objects.filter(pk__in=post_ids).delete()
+    return len(post_ids)
+
+
+class ArchiveChain:
+    """
+    Hot posts followed by archived ones, as one list for the Paginator.
+    Archived posts are always older, so the order is kept.
+    """
+    ordered = True
+
+    def __init__(self, hot, archived):
+        self.hot = hot
+        self.archived = archived
+
+    @cached_property
+    def hot_count(self):
+        return self.hot.count()
+
+    def count(self):
+        return self.hot_count + self.archived.count()
+
+    def __getitem__(self, item):
+        start, stop = item.start or 0, item.stop
+        result = []
+        if start < self.hot_count:
+            result += list(self.hot[start:min(stop, self.hot_count)])
+        if stop > self.hot_count:
+            result += list(self.archived[max(start - self.hot_count, 0):
+                                         stop - self.hot_count])
+        return result
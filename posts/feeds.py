@@ -0,0 +1,171 @@
+"""
+RSS/Atom feeds of all posts, of a group and of an author.
+
+Serialized feeds are cached until a post in the feed's scope changes:
+every scope ("all", "group:<id>", "author:<id>") has a version stamp in
+the cache that is bumped from posts/signals.py. Scopes are keyed by id,
+so a saved post bumps them without looking up its author or group; the
+feed views resolve the slug or username through posts/object_cache.py.
+The stamp is also the ETag and Last-Modified of the feed, so a poll of
+an unchanged feed costs a couple of cache lookups and a 304. Stamps
+expire with the cached feeds (FEEDS_CACHE_TIMEOUT).
+"""
+import hashlib
+import time
+from datetime import datetime
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.syndication.views import Feed
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.text import Truncator
+from django.utils.timezone import utc
+from django.views.decorators.http import condition
+
+from . import object_cache
+from .models import Group, Post, User
+
+VERSION_KEY = "feeds:version:{}"
+
+
+def feed_scope(kwargs):
+    """Scope of a feed URL, None for a missing group or author"""
+    if "slug" in kwargs:
+        group = object_cache.get_by(Group, "slug", kwargs["slug"])
+        return group and f"group:{group.pk}"
+    if "username" in kwargs:
+        user = object_cache.get_by(User, "username", kwargs["username"])
+        return user and f"author:{user.pk}"
+    return "all"
+
+
+def post_scopes(author_id, group_ids=()):
+    return {"all", f"author:{author_id}",
+            *(f"group:{group_id}" for group_id in group_ids)}
+
+
+def feed_version(scope):
+    if scope is None:
+        # the feed view answers 404, nothing to remember
+        return 0
+    key = VERSION_KEY.format(scope)
+    version = cache.get(key)
+    if version is None:
+        version = time.time()
+        cache.set(key, version, settings.FEEDS_CACHE_TIMEOUT)
+    return version
+
+
+def bump_feed_versions(scopes):
+    now = time.time()
+    cache.set_many({VERSION_KEY.format(scope): now for scope in scopes},
+                   settings.FEEDS_CACHE_TIMEOUT)
+
+
+def cached_feed(feed):
+    def last_modified(request, **kwargs):
+        return datetime.fromtimestamp(feed_version(feed_scope(kwargs)),
+                                      tz=utc)
+
+    def etag(request, **kwargs):
+        version = feed_version(feed_scope(kwargs))
+        return hashlib.md5(f"{request.path}:{version}".encode()).hexdigest()
+
+    @wraps(feed)
+    @condition(etag_func=etag, last_modified_func=last_modified)
+    def view(request, **kwargs):
+        key = "feeds:body:" + etag(request, **kwargs)
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+        response = feed(request, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, (response.content, response["Content-Type"]),
+                      settings.FEEDS_CACHE_TIMEOUT)
+        return response
+    return view
+
+
+class LatestPostsFeed(Feed):
+    title = "Yatube: последние записи"
+    description = "Последние записи всех авторов"
+
+    def link(self):
+        return reverse("index")
+
+    def items(self):
+        return (Post.objects.select_related("author")
+                .filter(author__is_active=True)[:settings.FEEDS_SIZE])
+
+    def item_title(self, item):
+        return Truncator(item.text).words(8)
+
+    def item_description(self, item):
+        return item.html
+
+    def item_author_name(self, item):
+        return item.author.username
+
+    def item_pubdate(self, item):
+        return item.pub_date
+
+
+class GroupPostsFeed(LatestPostsFeed):
+
+    def get_object(self, request, slug):
+        return get_object_or_404(Group, slug=slug)
+
+    def title(self, group):
+        return f"Yatube: {group.title}"
+
+    def description(self, group):
+        return group.description
+
+    def link(self, group):
+        return reverse("group", args=[group.slug])
+
+    def items(self, group):
+        return (group.posts.select_related("author")
+                .filter(author__is_active=True)[:settings.FEEDS_SIZE])
+
+
+class AuthorPostsFeed(LatestPostsFeed):
+
+    def get_object(self, request, username):
+        return get_object_or_404(User, username=username, is_active=True)
+
+    def title(self, author):
+        return f"Yatube: @{author.username}"
+
+    def description(self, author):
+        return f"Записи автора @{author.username}"
+
+    def link(self, author):
+        return reverse("profile", args=[author.username])
+
+    def items(self, author):
+        return author.posts.select_related("author")[:settings.FEEDS_SIZE]
+
+
+class LatestPostsAtomFeed(LatestPostsFeed):
+    feed_type = Atom1Feed
+    subtitle = LatestPostsFeed.description
+
+
+class GroupPostsAtomFeed(GroupPostsFeed):
+    feed_type = Atom1Feed
+
+    def subtitle(self, group):
+        return self.description(group)
+
+
+class AuthorPostsAtomFeed(AuthorPostsFeed):
+    feed_type = Atom1Feed
+
+    def subtitle(self, author):
+        return self.description(author)
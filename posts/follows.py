@@ -0,0 +1,98 @@
+"""
+Following and unfollowing many authors at once.
+
+Usernames are resolved with username__in in chunks that fit SQLite's
+limit on query parameters, and Follow rows are inserted with
+bulk_create(ignore_conflicts=True) on top of the (user, author) unique
+constraint, so an import costs a few queries whatever its size.
+Follower counts are plain COUNTs on Follow and need no update.
+
+Uploaded files over FOLLOW_IMPORT_MAX_SIZE are refused before they are
+read; that is enough for FOLLOW_IMPORT_LIMIT names of any length.
+"""
+import csv
+import io
+import json
+import re
+
+from django.conf import settings
+
+from .models import Follow, User
+from .utils import chunked
+
+CHUNK_SIZE = 500
+SEPARATORS_RE = re.compile(r"[\s,;]+")
+
+
+class FollowImportError(ValueError):
+    pass
+
+
+def parse_text(text):
+    return [name.lstrip("@") for name in SEPARATORS_RE.split(text) if name]
+
+
+def parse_file(uploaded):
+    """Usernames from a CSV (first column) or JSON (list of names or of
+    objects with a "username") file"""
+    if uploaded.size > settings.FOLLOW_IMPORT_MAX_SIZE:
+        raise FollowImportError(
+            f"Файл больше {settings.FOLLOW_IMPORT_MAX_SIZE // 1024} КБ")
+    try:
+        content = uploaded.read().decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise FollowImportError("Файл должен быть в кодировке UTF-8")
+    if uploaded.name.lower().endswith(".json"):
+        try:
+            data = json.loads(content)
+        except ValueError:
+            raise FollowImportError("Некорректный JSON")
+        if not isinstance(data, list):
+            raise FollowImportError("JSON должен содержать список")
+        return [str(item.get("username", "") if isinstance(item, dict)
+                    else item).lstrip("@") for item in data]
+    names = [row[0].strip().lstrip("@")
+             for row in csv.reader(io.StringIO(content)) if row]
+    if names and names[0].lower() == "username":
+        names = names[1:]
+    return names
+
+
+def clean(usernames):
+    usernames = list(dict.fromkeys(name for name in usernames if name))
+    if len(usernames) > settings.FOLLOW_IMPORT_LIMIT:
+        raise FollowImportError(f"Не больше {settings.FOLLOW_IMPORT_LIMIT} "
+                                f"авторов за раз")
+    return usernames
+
+
+def follow_many(user, usernames):
+    """Follow the authors, returns counts and the unknown usernames"""
+    usernames = clean(usernames)
+    result = {"followed": 0, "already": 0, "missing": []}
+    for chunk in chunked(usernames, CHUNK_SIZE):
+        authors = dict(User.objects.filter(username__in=chunk,
+                                           is_active=True)
+                       .exclude(pk=user.pk)
+                       .values_list("username", "pk"))
+        result["missing"] += [name for name in chunk if name not in authors
+                              and name != user.username]
+        existing = set(Follow.objects.filter(user=user,
+                                             author_id__in=authors.values())
+                       .values_list("author_id", flat=True))
+        Follow.objects.bulk_create(
+            (Follow(user=user, author_id=author_id)
+             for author_id in authors.values() if author_id not in existing),
+            ignore_conflicts=True)
+        result["followed"] += len(authors) - len(existing)
+        result["already"] += len(existing)
+    return result
+
+
+def unfollow_many(user, usernames):
+    """Unfollow the authors, returns how many follows were removed"""
+    removed = 0
+    for chunk in chunked(clean(usernames), CHUNK_SIZE):
+        removed += Follow.objects.filter(
+            user=user, author__username__in=chunk).delete()[0]
+    return {"unfollowed": removed}
@@ -1,6 +1,7 @@
 from django import forms
 from django.utils.translation import ugettext_lazy as _
 
+from .follows import FollowImportError, parse_file, parse_text
 from .models import Comment, Post
 
 
@@ -17,3 +18,38 @@ class CommentForm(forms.ModelForm):
         labels = {
             'text': _('Комментарий'),
         }
+
+
+class FollowImportForm(forms.Form):
+    FOLLOW = "follow"
+    UNFOLLOW = "unfollow"
+
+    usernames = forms.CharField(
+        label=_("Авторы"),
+        widget=forms.Textarea,
+        required=False,
+        help_text=_("Имена через пробел, запятую или с новой строки"),
+    )
+    file = forms.FileField(
+        label=_("Файл"),
+        required=False,
+        help_text=_("CSV с именами в первой колонке или JSON-список"),
+    )
+    action = forms.ChoiceField(
+        label=_("Действие"),
+        choices=((FOLLOW, _("Подписаться")), (UNFOLLOW, _("Отписаться"))),
+        initial=FOLLOW,
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        names = parse_text(cleaned_data.get("usernames") or "")
+        if cleaned_data.get("file"):
+            try:
+                names += parse_file(cleaned_data["file"])
+            except FollowImportError as e:
+                raise forms.ValidationError(str(e))
+        if not names:
+            raise forms.ValidationError(_("Укажите авторов или файл"))
+        cleaned_data["names"] = names
+        return cleaned_data
@@ -0,0 +1,66 @@
+"""
+Incremental maintenance of GroupStats.
+
+posts_count and last_post are adjusted with single UPDATE statements.
+recent_authors needs a recount over the (group, pub_date) index for the
+recent window of the group; it is deferred until after the response
+and runs once per transaction and group however many posts changed.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Max, Q
+from django.utils import timezone
+
+from .models import ArchivedPost, GroupStats, Post
+from .tasks import defer_once
+
+
+def recent_authors(group_id):
+    since = timezone.now() - timedelta(days=settings.GROUP_STATS_RECENT_DAYS)
+    return (Post.objects.filter(group_id=group_id, pub_date__gte=since)
+            .order_by().values("author_id").distinct().count())
+
+
+def last_post(group_id):
+    """Archived posts are older than hot ones, look there only if needed"""
+    for model in (Post, ArchivedPost):
+        date = (model.objects.filter(group_id=group_id)
+                .aggregate(last=Max("pub_date"))["last"])
+        if date is not None:
+            return date
+    return None
+
+
+def update_recent_authors(group_id):
+    GroupStats.objects.filter(pk=group_id).update(
+        recent_authors=recent_authors(group_id))
+
+
+def post_added(group_id, pub_date):
+    GroupStats.objects.get_or_create(group_id=group_id)
+    stats = GroupStats.objects.filter(pk=group_id)
+    stats.update(posts_count=F("posts_count") + 1)
+    stats.filter(Q(last_post__lt=pub_date) | Q(last_post__isnull=True)) \
+        .update(last_post=pub_date)
+    defer_once(update_recent_authors, group_id)
+
+
+def post_removed(group_id, pub_date):
+    stats = GroupStats.objects.filter(pk=group_id)
+    stats.filter(posts_count__gt=0).update(
+        posts_count=F("posts_count") - 1)
+    if stats.filter(last_post__lte=pub_date).exists():
+        stats.update(last_post=last_post(group_id))
+    defer_once(update_recent_authors, group_id)
+
+
+def rebuild(group_id):
+    """Exact recount, for the rebuild_group_stats command"""
+    posts_count = sum(model.objects.filter(group_id=group_id).count()
+                      for model in (Post, ArchivedPost))
+    GroupStats.objects.update_or_create(
+        group_id=group_id,
+        defaults={"posts_count": posts_count,
+                  "last_post": last_post(group_id),
+                  "recent_authors": recent_authors(group_id)})
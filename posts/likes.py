@@ -0,0 +1,91 @@
+"""
+Likes with sharded counters.
+
+Every like is a Like row (so liking twice is a no-op), the totals live in
+LIKE_COUNTER_SHARDS LikeCounter rows per post. A like or unlike updates
+one random shard, so concurrent likes of a viral post do not all wait
+for the same row lock. Pages read the totals of all their posts with a
+single SUM ... GROUP BY query.
+
+Cached page fragments showing the user's likes include like_version()
+in their key; it changes when the user likes or unlikes something.
+"""
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+
+from .models import Like, LikeCounter
+
+
+def bump_counter(post_id, delta):
+    shard = random.randrange(settings.LIKE_COUNTER_SHARDS)
+    counter = LikeCounter.objects.filter(post_id=post_id, shard=shard)
+    if counter.update(count=F("count") + delta):
+        return
+    try:
+        with transaction.atomic():
+            LikeCounter.objects.create(post_id=post_id, shard=shard,
+                                       count=delta)
+    except IntegrityError:
+        # created by a concurrent request
+        counter.update(count=F("count") + delta)
+
+
+def version_key(user_id):
+    return f"likes:version:{user_id}"
+
+
+def like_version(user):
+    if not user.is_authenticated:
+        return 0
+    return cache.get(version_key(user.pk), 0)
+
+
+def bump_version(user_id):
+    transaction.on_commit(
+        lambda: cache.set(version_key(user_id), time.time_ns(), None))
+
+
+def like(user, post_id):
+    with transaction.atomic():
+        _, created = Like.objects.get_or_create(user=user, post_id=post_id)
+        if created:
+            bump_counter(post_id, 1)
+            bump_version(user.pk)
+    return created
+
+
+def unlike(user, post_id):
+    with transaction.atomic():
+        deleted, _ = Like.objects.filter(user=user, post_id=post_id).delete()
+        if deleted:
+            bump_counter(post_id, -1)
+            bump_version(user.pk)
+    return bool(deleted)
+
+
+def with_likes(posts, user):
+    """
+    Set likes_count and liked on every post of a page, in one query
+    (two for a logged-in user).
+    """
+    ids = [post.pk for post in posts if not post.is_archived]
+    counts, liked = {}, set()
+    if ids:
+        counts = dict(LikeCounter.objects.filter(post_id__in=ids)
+                      .values("post_id")
+                      .annotate(total=Sum("count"))
+                      .values_list("post_id", "total"))
+    if ids and user.is_authenticated:
+        liked = set(Like.objects.filter(user=user, post_id__in=ids)
+                    .values_list("post_id", flat=True))
+    for post in posts:
+        post.liked = post.pk in liked
+        if not post.is_archived:
+            # archived posts keep the count frozen at archiving
+            post.likes_count = counts.get(post.pk, 0)
+    return posts
@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts.archive import archive_batch
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = "Move old posts and their comments to the archive tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int,
+                            default=settings.ARCHIVE_AFTER_DAYS)
+        parser.add_argument("--batch-size", type=int, default=200)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        old = (Post.objects.filter(pub_date__lt=cutoff)
+               .order_by("pk").values_list("pk", flat=True))
+        archived = 0
+        while True:
+            batch = list(old[:options["batch_size"]])
+            if not batch:
+                break
+            archived += archive_batch(batch)
+        self.stdout.write(f"Archived {archived} posts")
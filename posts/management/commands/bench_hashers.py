@@ -0,0 +1,79 @@
+"""
+Password hashing benchmark.
+
+Uses the configured hasher, PASSWORD_HASHERS[0], so with
+yatube.hashers.PBKDF2PasswordHasher every verification goes through the
+PASSWORD_HASH_WORKERS slots like a real login. For every iteration
+count a password is verified in a loop for --seconds, first by one
+caller (logins per core per second) and then by --threads callers at
+once: the logins per second the slots let through and the ones turned
+away after PASSWORD_HASH_WAIT (answered with 503 by the site).
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher
+from django.core.management.base import BaseCommand
+
+from yatube.hashers import HashingBusy
+
+
+def verify_rate(hasher, encoded, seconds, threads):
+    """(verified, turned away) per second"""
+    counts = [0] * threads
+    busy = [0] * threads
+    deadline = time.perf_counter() + seconds
+
+    def work(i):
+        while time.perf_counter() < deadline:
+            try:
+                hasher.verify("password", encoded)
+            except HashingBusy:
+                busy[i] += 1
+            else:
+                counts[i] += 1
+
+    workers = [threading.Thread(target=work, args=(i,))
+               for i in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    return sum(counts) / elapsed, sum(busy) / elapsed
+
+
+class Command(BaseCommand):
+    help = ("Measure logins per second of the configured hasher for "
+            "PBKDF2 iteration counts")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, nargs="+",
+                            help="default: PASSWORD_PBKDF2_ITERATIONS")
+        parser.add_argument("--seconds", type=float, default=2)
+        parser.add_argument("--threads", type=int,
+                            default=2 * settings.PASSWORD_HASH_WORKERS,
+                            help="concurrent callers, default: twice "
+                                 "PASSWORD_HASH_WORKERS")
+
+    def handle(self, *args, **options):
+        hasher = get_hasher("default")
+        iterations = (options["iterations"]
+                      or [settings.PASSWORD_PBKDF2_ITERATIONS])
+        threads = options["threads"]
+        self.stdout.write(
+            f"{type(hasher).__module__}.{type(hasher).__name__}, "
+            f"{settings.PASSWORD_HASH_WORKERS} slots")
+        self.stdout.write(f"{'iterations':>10} {'ms/login':>9} "
+                          f"{'per core/s':>11} {f'{threads} threads/s':>12} "
+                          f"{'busy/s':>7}")
+        for count in iterations:
+            encoded = hasher.encode("password", hasher.salt(), count)
+            single, _ = verify_rate(hasher, encoded, options["seconds"], 1)
+            parallel, busy = verify_rate(hasher, encoded,
+                                         options["seconds"], threads)
+            self.stdout.write(f"{count:>10} {1000 / single:>9.1f} "
+                              f"{single:>11.1f} {parallel:>12.1f} "
+                              f"{busy:>7.1f}")
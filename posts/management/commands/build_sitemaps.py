@@ -0,0 +1,36 @@
+import os
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.management.base import BaseCommand
+
+from posts.sitemaps import (SITEMAPS, render_index, render_section,
+                            sitemap_path, write_sitemap)
+
+
+class Command(BaseCommand):
+    help = ("Regenerate all sitemap files in SITEMAP_ROOT, remove the "
+            "files of pages that became empty")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--protocol", default="https")
+
+    def handle(self, *args, **options):
+        site = Site.objects.get_current()
+        protocol = options["protocol"]
+        written = set()
+        for section, sitemap in SITEMAPS.items():
+            for page in sitemap.paginator.page_range:
+                name = f"{section}-{page}"
+                write_sitemap(name,
+                              render_section(section, page, site, protocol))
+                written.add(sitemap_path(name))
+        write_sitemap("index", render_index(site, protocol))
+        written.add(sitemap_path("index"))
+        removed = 0
+        for entry in os.scandir(settings.SITEMAP_ROOT):
+            if entry.name.endswith(".xml") and entry.path not in written:
+                os.remove(entry.path)
+                removed += 1
+        self.stdout.write(f"Written {len(written)} sitemap files, "
+                          f"removed {removed}")
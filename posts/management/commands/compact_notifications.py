@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts.models import Notification
+
+
+class Command(BaseCommand):
+    help = "Delete old notifications in small batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--read-days", type=int, default=30,
+                            help="keep read notifications for N days")
+        parser.add_argument("--unread-days", type=int, default=90,
+                            help="keep unread notifications for N days")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        stale = (
+            Notification.objects.filter(
+                is_read=True,
+                created__lt=now - timedelta(days=options["read_days"]))
+            | Notification.objects.filter(
+                created__lt=now - timedelta(days=options["unread_days"]))
+        )
+        ids = stale.order_by().values_list("pk", flat=True)
+        deleted = 0
+        while True:
+            batch = list(ids[:options["batch_size"]])
+            if not batch:
+                break
+            deleted += Notification.objects.filter(pk__in=batch).delete()[0]
+        self.stdout.write(f"Deleted {deleted} notifications")
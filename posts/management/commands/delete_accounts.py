@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from posts.accounts import process
+from posts.models import AccountDeletion
+
+
+class Command(BaseCommand):
+    help = ("Delete the content of deactivated accounts in small batches. "
+            "Safe to interrupt and run again")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int)
+        parser.add_argument("--pause", type=float, default=0,
+                            help="seconds to wait between batches")
+
+    def handle(self, *args, **options):
+        pending = AccountDeletion.objects.filter(finished__isnull=True)
+        for deletion in pending.order_by("requested"):
+            deleted = process(deletion, options["batch_size"],
+                              options["pause"])
+            self.stdout.write(f"Deleted {deletion.username}: "
+                              f"{deleted} rows")
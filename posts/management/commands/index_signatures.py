@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from posts import spam
+from posts.models import Comment, Post, Signature
+from posts.utils import pk_batches
+
+
+class Command(BaseCommand):
+    help = ("Store MinHash signatures of existing posts and comments. "
+            "With --flag also flag near-duplicates among them")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--flag", action="store_true")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        for kind, model in ((Signature.POST, Post),
+                            (Signature.COMMENT, Comment)):
+            indexed = 0
+            for batch in pk_batches(model.objects.all(),
+                                    options["batch_size"]):
+                for pk, author_id, text in (model.objects
+                                            .filter(pk__in=batch)
+                                            .values_list("pk", "author_id",
+                                                         "text")):
+                    spam.index(kind, pk, author_id, text,
+                               flag=options["flag"])
+                indexed += len(batch)
+            self.stdout.write(f"Indexed {indexed} {kind}s")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from posts import tags
+from posts.models import Post
+from posts.utils import pk_batches
+
+
+class Command(BaseCommand):
+    help = "Index #tags and @mentions of posts saved before the index existed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        indexed = 0
+        for batch in pk_batches(Post.objects.all(), options["batch_size"]):
+            for post in (Post.objects.filter(pk__in=batch)
+                         .only("pk", "text", "pub_date")):
+                tags.sync_post(post)
+            indexed += len(batch)
+        self.stdout.write(f"Indexed {indexed} posts")
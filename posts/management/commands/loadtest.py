@@ -0,0 +1,281 @@
+"""
+In-process load generator.
+
+Drives the WSGI application of yatube/wsgi.py from worker threads,
+without sockets or external tools, and reports throughput, latency
+percentiles and errors per URL name for every concurrency stage.
+
+A scenario is a JSON file with weighted requests:
+
+    {"requests": [
+        {"path": "/", "weight": 50},
+        {"path": "/follow/", "weight": 10, "login": true},
+        {"path": "/{author}/{post_id}/comment/", "method": "POST",
+         "data": {"text": "load"}, "weight": 2, "login": true}
+    ]}
+
+Paths may use {author} (random author), {post_author} and {post_id}
+(random recent post) and {group} (random group slug). Logged-in requests
+get a session of one of --users throwaway users and a CSRF token.
+
+The run writes to the configured database, so point it at a staging
+copy. The throwaway users are removed afterwards with everything they
+created (posts, comments, follows, likes, notifications), through
+posts/accounts.py, together with their sessions. --keep-data leaves
+them in place for inspection.
+"""
+import json
+import logging
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from io import BytesIO
+from urllib.parse import urlencode
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.contrib.auth import (BACKEND_SESSION_KEY, HASH_SESSION_KEY,
+                                 SESSION_KEY)
+from django.contrib.sessions.backends.cached_db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import got_request_exception
+from django.db import OperationalError, connections
+from django.http import HttpRequest
+from django.middleware.csrf import get_token
+from django.urls import Resolver404, resolve
+
+from posts import tasks
+from posts.accounts import process, request_deletion
+from posts.models import AccountDeletion, Group, Post, User
+
+DEFAULT_SCENARIO = {"requests": [
+    {"path": "/", "weight": 40},
+    {"path": "/?page=2", "weight": 10},
+    {"path": "/group/{group}/", "weight": 10},
+    {"path": "/{author}/", "weight": 10},
+    {"path": "/{post_author}/{post_id}/", "weight": 15},
+    {"path": "/follow/", "weight": 8, "login": True},
+    {"path": "/new", "method": "POST", "weight": 2, "login": True,
+     "data": {"text": "load test post"}},
+    {"path": "/{post_author}/{post_id}/comment/", "method": "POST",
+     "weight": 3, "login": True, "data": {"text": "load test comment"}},
+    {"path": "/{author}/follow/", "weight": 2, "login": True},
+]}
+
+_local = threading.local()
+
+
+def on_exception(sender, request=None, **kwargs):
+    _local.exception = sys.exc_info()[1]
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0
+    index = max(0, min(len(sorted_values) - 1,
+                       round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = "Run a weighted traffic mix against the WSGI app in-process"
+
+    def add_arguments(self, parser):
+        parser.add_argument("scenario", nargs="?",
+                            help="JSON scenario file, see module docs")
+        parser.add_argument("--stages", default="1,2,4,8",
+                            help="comma separated concurrency levels")
+        parser.add_argument("--duration", type=float, default=10,
+                            help="seconds per stage")
+        parser.add_argument("--users", type=int, default=10,
+                            help="throwaway users to spread sessions over")
+        parser.add_argument("--keep-data", action="store_true",
+                            help="keep the users and what they created")
+        parser.add_argument("--no-ratelimit", action="store_true",
+                            help="disable rate limits for the run")
+        parser.add_argument("--seed", type=int)
+
+    def handle(self, *args, **options):
+        from yatube.wsgi import application
+        self.application = application
+        if options["seed"] is not None:
+            random.seed(options["seed"])
+        if options["no_ratelimit"]:
+            settings.RATELIMIT_ENABLED = False
+        logging.getLogger("django.request").setLevel(logging.CRITICAL)
+
+        self.requests = self.load_scenario(options["scenario"])
+        self.weights = [request.get("weight", 1) for request in self.requests]
+        try:
+            stages = [int(c) for c in options["stages"].split(",")]
+        except ValueError:
+            raise CommandError("--stages must be integers, e.g. 1,2,4")
+
+        self.users, self.session_keys = [], []
+        got_request_exception.connect(on_exception)
+        try:
+            self.prepare_data(options["users"])
+            for concurrency in stages:
+                results = self.run_stage(concurrency, options["duration"])
+                self.report(concurrency, options["duration"], results)
+        finally:
+            got_request_exception.disconnect(on_exception)
+            if not options["keep_data"]:
+                self.clean_up()
+
+    def load_scenario(self, path):
+        if path is None:
+            return DEFAULT_SCENARIO["requests"]
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)["requests"]
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f"Bad scenario {path}: {e}")
+
+    def prepare_data(self, users_count):
+        self.posts = list(Post.objects.values_list("author__username", "id")
+                          [:1000])
+        self.authors = list(User.objects.filter(posts__isnull=False)
+                            .distinct().values_list("username", flat=True)
+                            [:1000])
+        self.groups = list(Group.objects.values_list("slug", flat=True)
+                           [:1000])
+        if not self.posts and any("{post" in r["path"]
+                                  for r in self.requests):
+            raise CommandError("Scenario needs posts in the database")
+        prefix = f"loadtest-{uuid.uuid4().hex[:8]}"
+        for i in range(users_count):
+            self.users.append(User.objects.create_user(f"{prefix}-{i}"))
+        self.sessions = [self.login(user) for user in self.users]
+
+    def login(self, user):
+        session = SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        self.session_keys.append(session.session_key)
+        request = HttpRequest()
+        token = get_token(request)
+        cookie = (f"{settings.SESSION_COOKIE_NAME}={session.session_key}; "
+                  f"{settings.CSRF_COOKIE_NAME}="
+                  f"{request.META['CSRF_COOKIE']}")
+        return cookie, token
+
+    def clean_up(self):
+        """Remove the throwaway users, their content and sessions"""
+        # deferred work of the last requests may still refer to them
+        tasks.join()
+        for key in self.session_keys:
+            SessionStore(session_key=key).delete()
+        for user in self.users:
+            request_deletion(user)
+            process(AccountDeletion.objects.get(user_id=user.pk))
+        AccountDeletion.objects.filter(
+            user_id__in=[user.pk for user in self.users]).delete()
+        self.stdout.write(f"Removed {len(self.users)} load test users "
+                          f"and their data")
+
+    def build_path(self, template):
+        post_author, post_id = random.choice(self.posts or [("", 0)])
+        return template.format(
+            author=random.choice(self.authors or [""]),
+            post_author=post_author,
+            post_id=post_id,
+            group=random.choice(self.groups or [""]),
+        )
+
+    def call(self, request):
+        method = request.get("method", "GET")
+        path = self.build_path(request["path"])
+        path_info, _, query = path.partition("?")
+        body = urlencode(request.get("data", {})).encode()
+        environ = {}
+        setup_testing_defaults(environ)
+        environ.update({
+            "REQUEST_METHOD": method,
+            "PATH_INFO": path_info,
+            "QUERY_STRING": query,
+            "CONTENT_TYPE": "application/x-www-form-urlencoded",
+            "CONTENT_LENGTH": str(len(body)),
+            "wsgi.input": BytesIO(body),
+        })
+        if request.get("login") and self.sessions:
+            cookie, token = random.choice(self.sessions)
+            environ["HTTP_COOKIE"] = cookie
+            environ["HTTP_X_CSRFTOKEN"] = token
+
+        status = []
+        _local.exception = None
+        start = time.perf_counter()
+        response = self.application(
+            environ, lambda s, headers, exc_info=None: status.append(s))
+        try:
+            for _ in response:
+                pass
+        finally:
+            if hasattr(response, "close"):
+                response.close()
+        elapsed = time.perf_counter() - start
+
+        code = int(status[0].split()[0])
+        exception = _local.exception
+        locked = (isinstance(exception, OperationalError)
+                  and "locked" in str(exception))
+        return request.get("name") or self.url_name(path_info), \
+            elapsed, code, locked
+
+    def url_name(self, path):
+        try:
+            return resolve(path).url_name or path
+        except Resolver404:
+            return path
+
+    def worker(self, deadline, results):
+        try:
+            while time.monotonic() < deadline:
+                request = random.choices(self.requests, self.weights)[0]
+                results.append(self.call(request))
+        finally:
+            connections.close_all()
+
+    def run_stage(self, concurrency, duration):
+        deadline = time.monotonic() + duration
+        per_thread = [[] for _ in range(concurrency)]
+        threads = [threading.Thread(target=self.worker,
+                                    args=(deadline, results))
+                   for results in per_thread]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return [result for results in per_thread for result in results]
+
+    def report(self, concurrency, duration, results):
+        by_name = defaultdict(list)
+        for name, elapsed, code, locked in results:
+            by_name[name].append((elapsed, code, locked))
+        total_errors = sum(code >= 500 for _, _, code, _ in results)
+        total_locked = sum(locked for *_, locked in results)
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"concurrency {concurrency}: {len(results)} requests, "
+            f"{len(results) / duration:.1f} req/s, "
+            f"{total_errors} errors, {total_locked} 'database is locked'"))
+        self.stdout.write(
+            f"{'url name':<20}{'count':>7}{'req/s':>8}{'p50 ms':>9}"
+            f"{'p95 ms':>9}{'p99 ms':>9}{'err %':>7}{'429':>6}{'locked':>8}")
+        for name, rows in sorted(by_name.items()):
+            latencies = sorted(elapsed * 1000 for elapsed, _, _ in rows)
+            errors = sum(code >= 500 for _, code, _ in rows)
+            throttled = sum(code == 429 for _, code, _ in rows)
+            locked = sum(locked for _, _, locked in rows)
+            self.stdout.write(
+                f"{name[:19]:<20}{len(rows):>7}{len(rows) / duration:>8.1f}"
+                f"{percentile(latencies, 50):>9.1f}"
+                f"{percentile(latencies, 95):>9.1f}"
+                f"{percentile(latencies, 99):>9.1f}"
+                f"{100 * errors / len(rows):>7.1f}{throttled:>6}"
+                f"{locked:>8}")
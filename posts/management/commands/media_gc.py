@@ -0,0 +1,188 @@
+"""
+Delete media files nothing refers to any more.
+
+Referenced names are streamed into a temporary SQLite database: images
+of posts, archived posts and revisions, then the sorl-thumbnail KV store
+rows of thumbnails whose source is one of those images. MEDIA_GC_DIRS
+under MEDIA_ROOT are then walked with os.scandir and every file is
+looked up in batches, so memory stays bounded whatever the media size.
+
+Files younger than --min-age are kept: they may belong to an upload or
+a thumbnail being written right now; storing a duplicate of an image
+touches it, see posts/storage.py. Deletions run in --workers threads
+at no more than --rate files per second. KV entries of thumbnails that
+no longer exist are dropped too, so sorl regenerates them if needed.
+"""
+import os
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.helpers import deserialize
+from sorl.thumbnail.images import deserialize_image_file
+from sorl.thumbnail.models import KVStore
+
+from posts.models import (ArchivedPost, ArchivedPostRevision, Post,
+                          PostRevision)
+from posts.utils import chunked
+
+BATCH_SIZE = 500
+
+
+def scan(root, directory):
+    """Relative names and mtimes of all files under root/directory"""
+    stack = [os.path.join(root, directory)]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    name = os.path.relpath(entry.path, root)
+                    yield (name.replace(os.sep, "/"),
+                           entry.stat(follow_symlinks=False).st_mtime)
+
+
+class Command(BaseCommand):
+    help = "Delete orphaned media files and thumbnails"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true",
+                            help="only list what would be deleted")
+        parser.add_argument("--min-age", type=int, default=60 * 60,
+                            help="keep files modified in the last N seconds")
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--rate", type=float, default=200,
+                            help="max deletions per second, 0 for no limit")
+
+    def handle(self, *args, **options):
+        self.options = options
+        with tempfile.TemporaryDirectory() as tmp:
+            self.db = sqlite3.connect(os.path.join(tmp, "refs.sqlite3"),
+                                      check_same_thread=False)
+            self.db.executescript("""
+                CREATE TABLE refs (name TEXT PRIMARY KEY) WITHOUT ROWID;
+                CREATE TABLE kv (key TEXT PRIMARY KEY, name TEXT)
+                    WITHOUT ROWID;
+                CREATE TABLE thumbs (source TEXT, thumb TEXT);
+            """)
+            try:
+                self.collect_references()
+                deleted, size = self.delete_orphans()
+                stale = self.drop_stale_thumbnails()
+            finally:
+                self.db.close()
+        verb = "Would delete" if options["dry_run"] else "Deleted"
+        self.stdout.write(f"{verb} {deleted} files ({size} bytes) "
+                          f"and {stale} thumbnail records")
+
+    def collect_references(self):
+        for queryset in (Post.objects.exclude(image=""),
+                         ArchivedPost.objects.exclude(image=""),
+                         PostRevision.objects.exclude(image=""),
+                         ArchivedPostRevision.objects.exclude(image="")):
+            names = (queryset.exclude(image__isnull=True)
+                     .values_list("image", flat=True).iterator())
+            for batch in chunked(names, BATCH_SIZE):
+                self.db.executemany("INSERT OR IGNORE INTO refs VALUES (?)",
+                                    ((name,) for name in batch))
+
+        prefix = thumbnail_settings.THUMBNAIL_KEY_PREFIX
+        rows = (KVStore.objects.filter(key__startswith=prefix)
+                .values_list("key", "value").iterator())
+        for batch in chunked(rows, BATCH_SIZE):
+            for key, value in batch:
+                _, identity, key = key.split("||")
+                if identity == "image":
+                    self.db.execute("INSERT OR REPLACE INTO kv VALUES (?, ?)",
+                                    (key, deserialize(value)["name"]))
+                elif identity == "thumbnails":
+                    self.db.executemany(
+                        "INSERT INTO thumbs VALUES (?, ?)",
+                        ((key, thumb) for thumb in deserialize(value)))
+        # thumbnails of referenced sources are referenced too
+        self.db.execute("""
+            INSERT OR IGNORE INTO refs
+            SELECT thumb.name FROM thumbs
+            JOIN kv source ON source.key = thumbs.source
+            JOIN refs ON refs.name = source.name
+            JOIN kv thumb ON thumb.key = thumbs.thumb
+        """)
+        self.db.commit()
+
+    def orphans(self):
+        cutoff = time.time() - self.options["min_age"]
+        for directory in settings.MEDIA_GC_DIRS:
+            files = scan(settings.MEDIA_ROOT, directory)
+            for batch in chunked(files, BATCH_SIZE):
+                names = [name for name, mtime in batch if mtime < cutoff]
+                if not names:
+                    continue
+                referenced = {name for name, in self.db.execute(
+                    "SELECT name FROM refs WHERE name IN (%s)"
+                    % ",".join("?" * len(names)), names)}
+                yield from (name for name in names
+                            if name not in referenced)
+
+    def throttled(self, names):
+        rate = self.options["rate"]
+        start = time.monotonic()
+        for count, name in enumerate(names):
+            if rate:
+                delay = start + count / rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            yield name
+
+    def delete(self, name):
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        try:
+            size = os.path.getsize(path)
+            if not self.options["dry_run"]:
+                os.remove(path)
+        except FileNotFoundError:
+            return 0
+        return size
+
+    def delete_orphans(self):
+        deleted = total = 0
+        workers = self.options["workers"]
+        with ThreadPoolExecutor(workers) as executor:
+            for batch in chunked(self.throttled(self.orphans()),
+                                 workers * 4):
+                for name, size in zip(batch, executor.map(self.delete,
+                                                          batch)):
+                    if self.options["verbosity"] > 1:
+                        self.stdout.write(name)
+                    deleted += 1
+                    total += size
+        return deleted, total
+
+    def drop_stale_thumbnails(self):
+        prefix = thumbnail_settings.THUMBNAIL_KEY_PREFIX
+        stale = 0
+        rows = self.db.execute(
+            "SELECT key, name FROM kv "
+            "WHERE name NOT IN (SELECT name FROM refs)")
+        for batch in iter(lambda: rows.fetchmany(BATCH_SIZE), []):
+            for key, name in batch:
+                if os.path.exists(os.path.join(settings.MEDIA_ROOT, name)):
+                    continue
+                stale += 1
+                if self.options["dry_run"]:
+                    continue
+                value = (KVStore.objects
+                         .filter(key=f"{prefix}||image||{key}")
+                         .values_list("value", flat=True).first())
+                if value is not None:
+                    default.kvstore.delete(deserialize_image_file(value))
+        return stale
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from posts import group_stats
+from posts.models import Group
+
+
+class Command(BaseCommand):
+    help = ("Recount activity of all groups. Run daily so that "
+            "recent_authors also drops for groups without new posts")
+
+    def handle(self, *args, **options):
+        group_ids = Group.objects.values_list("pk", flat=True)
+        for group_id in group_ids.iterator():
+            group_stats.rebuild(group_id)
+        self.stdout.write(f"Rebuilt stats of {group_ids.count()} groups")
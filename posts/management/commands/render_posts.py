@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import ArchivedPost, Post
+from posts.rendering import render_html
+from posts.utils import pk_batches
+
+
+class Command(BaseCommand):
+    help = ("Fill the pre-rendered HTML of posts saved before it existed. "
+            "With --all re-render every post, e.g. after adding link types")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        for model in (Post, ArchivedPost):
+            posts = model.objects.all()
+            if not options["all"]:
+                posts = posts.filter(html="")
+            rendered = 0
+            for batch in pk_batches(posts, options["batch_size"]):
+                objects = list(model.objects.filter(pk__in=batch)
+                               .only("pk", "text"))
+                for post in objects:
+                    post.html = render_html(post.text)
+                model.objects.bulk_update(objects, ["html"])
+                rendered += len(objects)
+            self.stdout.write(
+                f"Rendered {rendered} {model._meta.verbose_name_plural}")
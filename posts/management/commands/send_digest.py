@@ -0,0 +1,114 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand
+from django.template.loader import get_template
+from django.urls import reverse
+from django.utils import timezone
+
+from posts.models import Digest, Follow, Post, User
+from posts.utils import chunked
+
+# keep IN (...) lists below the SQLite variables limit
+MAX_IN_LIST = 500
+
+
+class Command(BaseCommand):
+    help = "Email every user new posts of the authors they follow"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500,
+                            help=f"users per batch, at most {MAX_IN_LIST}")
+        parser.add_argument("--max-posts", type=int, default=20,
+                            help="posts per digest")
+        parser.add_argument("--days", type=int, default=7,
+                            help="look back for users without a digest")
+
+    def handle(self, *args, **options):
+        self.template = get_template("emails/digest.txt")
+        self.domain = Site.objects.get_current().domain
+        self.max_posts = options["max_posts"]
+        self.now = timezone.now()
+        self.default_since = self.now - timedelta(days=options["days"])
+        batch_size = min(options["batch_size"], MAX_IN_LIST)
+
+        users = (User.objects.filter(is_active=True)
+                 .exclude(email="")
+                 .only("pk", "username", "email")
+                 .order_by("pk")
+                 .iterator(chunk_size=batch_size))
+        sent = 0
+        for batch in chunked(users, batch_size):
+            sent += self.send_batch(batch)
+        self.stdout.write(f"Sent {sent} digests")
+
+    def send_batch(self, users):
+        ids = [user.pk for user in users]
+        last_sent = dict(Digest.objects.filter(user_id__in=ids)
+                         .values_list("user_id", "last_sent"))
+        since = {pk: last_sent.get(pk, self.default_since) for pk in ids}
+
+        following = defaultdict(set)
+        for user_id, author_id in (Follow.objects.filter(user_id__in=ids)
+                                   .values_list("user_id", "author_id")):
+            following[user_id].add(author_id)
+
+        posts_by_author = self.new_posts(
+            set().union(*following.values()),
+            min((since[pk] for pk in following), default=self.now),
+        )
+
+        messages = []
+        for user in users:
+            posts = sorted(
+                (post
+                 for author_id in following.get(user.pk, ())
+                 for post in posts_by_author.get(author_id, ())
+                 if post["pub_date"] > since[user.pk]),
+                key=lambda post: post["pub_date"],
+                reverse=True,
+            )
+            if not posts:
+                continue
+            body = self.template.render({
+                "user": user,
+                "posts": posts[:self.max_posts],
+                "more": max(len(posts) - self.max_posts, 0),
+                "protocol": "http",
+                "domain": self.domain,
+            })
+            messages.append(EmailMessage("Новые записи в Yatube",
+                                         body,
+                                         settings.DEFAULT_FROM_EMAIL,
+                                         [user.email]))
+        if messages:
+            connection = get_connection()
+            connection.send_messages(messages)
+            connection.close()
+        self.mark_sent(ids, last_sent)
+        return len(messages)
+
+    def new_posts(self, author_ids, since):
+        """All posts of the batch's authors in a few set-based queries"""
+        posts_by_author = defaultdict(list)
+        for authors in chunked(sorted(author_ids), MAX_IN_LIST):
+            posts = (Post.objects
+                     .filter(author_id__in=authors, pub_date__gt=since)
+                     .order_by()
+                     .values("id", "text", "pub_date",
+                             "author_id", "author__username"))
+            for post in posts:
+                post["url"] = reverse(
+                    "post", args=[post["author__username"], post["id"]])
+                posts_by_author[post["author_id"]].append(post)
+        return posts_by_author
+
+    def mark_sent(self, ids, last_sent):
+        known = [Digest(user_id=pk, last_sent=self.now)
+                 for pk in ids if pk in last_sent]
+        Digest.objects.bulk_update(known, ["last_sent"])
+        Digest.objects.bulk_create(Digest(user_id=pk, last_sent=self.now)
+                                   for pk in ids if pk not in last_sent)
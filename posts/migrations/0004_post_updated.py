@@ -0,0 +1,26 @@
+# Generated by Django 2.2.28 on 2026-10-19 13:07
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_updated(apps, schema_editor):
+    # AddField stamped every row with the migration time
+    Post = apps.get_model('posts', 'Post')
+    Post.objects.update(updated=F('pub_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0003_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, verbose_name='date updated'),
+        ),
+        migrations.RunPython(backfill_updated, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 2.2.28 on 2026-10-19 13:09
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import Max
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def fill_group_stats(apps, schema_editor):
+    Group = apps.get_model('posts', 'Group')
+    Post = apps.get_model('posts', 'Post')
+    GroupStats = apps.get_model('posts', 'GroupStats')
+    since = timezone.now() - timedelta(days=30)
+    for group_id in Group.objects.values_list('pk', flat=True).iterator():
+        posts = Post.objects.filter(group_id=group_id).order_by()
+        GroupStats.objects.create(
+            group_id=group_id,
+            posts_count=posts.count(),
+            last_post=posts.aggregate(last=Max('pub_date'))['last'],
+            recent_authors=posts.filter(pub_date__gte=since)
+            .values('author_id').distinct().count(),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_post_updated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupStats',
+            fields=[
+                ('group', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='posts.Group')),
+                ('posts_count', models.PositiveIntegerField(default=0)),
+                ('last_post', models.DateTimeField(blank=True, null=True)),
+                ('recent_authors', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', '-pub_date'], name='posts_post_group_i_1fdac4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='groupstats',
+            index=models.Index(fields=['-last_post'], name='posts_group_last_po_4035c8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='groupstats',
+            index=models.Index(fields=['-posts_count'], name='posts_group_posts_c_355b83_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='groupstats',
+            index=models.Index(fields=['-recent_authors'], name='posts_group_recent__d7e5ce_idx'),
+        ),
+        migrations.RunPython(fill_group_stats, migrations.RunPython.noop),
+    ]
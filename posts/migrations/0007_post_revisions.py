@@ -0,0 +1,35 @@
+# Generated by Django 2.2.28 on 2026-10-19 13:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0006_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='revision',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='PostRevision',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='created')),
+                ('is_snapshot', models.BooleanField(default=False)),
+                ('body', models.BinaryField()),
+                ('image', models.CharField(blank=True, max_length=100)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='posts.Post')),
+            ],
+            options={
+                'ordering': ('-number',),
+                'unique_together': {('post', 'number')},
+            },
+        ),
+    ]
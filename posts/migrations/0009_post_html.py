@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-19 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_likes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedpost',
+            name='html',
+            field=models.TextField(default=''),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='html',
+            field=models.TextField(default='', editable=False),
+        ),
+    ]
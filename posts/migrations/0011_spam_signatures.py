@@ -0,0 +1,58 @@
+# Generated by Django 2.2.28 on 2026-10-19 13:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0010_tags_mentions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Signature',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('post', 'Запись'), ('comment', 'Комментарий')], max_length=10)),
+                ('object_id', models.IntegerField()),
+                ('minhash', models.BinaryField()),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='created')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SpamFlag',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('similarity', models.FloatField()),
+                ('same_author', models.BooleanField()),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='created')),
+                ('resolved', models.BooleanField(default=False)),
+                ('duplicate_of', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='posts.Signature')),
+                ('signature', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='flags', to='posts.Signature')),
+            ],
+            options={
+                'ordering': ('-created',),
+            },
+        ),
+        migrations.CreateModel(
+            name='SignatureBand',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.BigIntegerField(db_index=True)),
+                ('signature', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bands', to='posts.Signature')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='spamflag',
+            index=models.Index(fields=['resolved', '-created'], name='posts_spamf_resolve_0b0d3f_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='signature',
+            unique_together={('kind', 'object_id')},
+        ),
+    ]
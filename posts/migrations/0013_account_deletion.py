@@ -0,0 +1,24 @@
+# Generated by Django 2.2.28 on 2026-10-19 13:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountDeletion',
+            fields=[
+                ('user_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('username', models.CharField(max_length=150)),
+                ('requested', models.DateTimeField(auto_now_add=True, verbose_name='requested')),
+                ('stage', models.CharField(blank=True, max_length=30)),
+                ('deleted', models.PositiveIntegerField(default=0)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 2.2.28 on 2026-10-19 14:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0013_account_deletion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedpost',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='ArchivedPostTag',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='date published')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='post_tags', to='posts.ArchivedPost')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_post_tags', to='posts.Tag')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedMention',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='date published')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mentions', to='posts.ArchivedPost')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_mentions', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedposttag',
+            index=models.Index(fields=['tag', '-pub_date', '-post'], name='posts_archi_tag_id_3dcee2_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='archivedposttag',
+            unique_together={('post', 'tag')},
+        ),
+        migrations.AddIndex(
+            model_name='archivedmention',
+            index=models.Index(fields=['user', '-pub_date', '-post'], name='posts_archi_user_id_48daf2_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='archivedmention',
+            unique_together={('post', 'user')},
+        ),
+    ]
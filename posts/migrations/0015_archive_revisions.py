@@ -0,0 +1,35 @@
+# Generated by Django 2.2.28 on 2026-10-19 14:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_archive_likes_tags'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedpost',
+            name='revision',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='ArchivedPostRevision',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('created', models.DateTimeField(verbose_name='created')),
+                ('is_snapshot', models.BooleanField(default=False)),
+                ('body', models.BinaryField()),
+                ('image', models.CharField(blank=True, max_length=100)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='posts.ArchivedPost')),
+            ],
+            options={
+                'ordering': ('-number',),
+                'unique_together': {('post', 'number')},
+            },
+        ),
+    ]
@@ -1,5 +1,9 @@
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.utils.functional import cached_property
+
+from .rendering import post_urls, render_html
+from .storage import content_storage
 
 User = get_user_model()
 
@@ -13,16 +17,24 @@ class Post(models.Model):
         The text of the post
     pub_date: DateTimeField()
         Date of publication
+    updated: DateTimeField()
+        Date of the last edit
     author:  ForeignKey, link -> User
         Author of the post
     group:   ForeignKey, link ->Group
         Link to the community(if available)
+    revision: PositiveIntegerField()
+        Number of saved revisions (edits)
+    html: TextField()
+        The text rendered to HTML on save, see posts/rendering.py
     """
     text = models.TextField()
+    html = models.TextField(default="", editable=False)
     pub_date = models.DateTimeField("date published",
                                     auto_now_add=True,
                                     db_index=True,
                                     )
+    updated = models.DateTimeField("date updated", auto_now=True)
     author = models.ForeignKey(User,
                                on_delete=models.CASCADE,
                                related_name="posts"
@@ -33,10 +45,47 @@ class Post(models.Model):
                               null=True,
                               related_name="posts"
                               )
-    image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    image = models.ImageField(upload_to='posts/',
+                              storage=content_storage,
+                              blank=True,
+                              null=True,
+                              )
+    revision = models.PositiveIntegerField(default=0, editable=False)
+
+    is_archived = False
+
+    urls = cached_property(post_urls, name="urls")
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(fields=["group", "-pub_date"]),
+        ]
+
+    def __str__(self):
+        return self.text[:50]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember loaded values to see what changed on save"""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        loaded = getattr(self, "_loaded_values", {})
+        if not self.html or loaded.get("text") != self.text:
+            self.html = render_html(self.text)
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "html"}
+        super().save(*args, **kwargs)
+        # post_save receivers have seen the old values, now they are saved
+        self._loaded_values = {field.attname: getattr(self, field.attname)
+                               for field in self._meta.concrete_fields}
+
+    def get_absolute_url(self):
+        return self.urls["post"]
 
 
 class Group(models.Model):
@@ -59,6 +108,37 @@ class Group(models.Model):
         return self.title
 
 
+class GroupStats(models.Model):
+    """
+    Activity of the community, kept up to date on every post change.
+    Parameters
+    -------
+    group: OneToOneField, link -> Group
+        The community
+    posts_count: PositiveIntegerField()
+        Number of posts, archived included
+    last_post: DateTimeField()
+        Date of the latest post
+    recent_authors: PositiveIntegerField()
+        Number of distinct authors over GROUP_STATS_RECENT_DAYS
+    """
+    group = models.OneToOneField(Group,
+                                 on_delete=models.CASCADE,
+                                 primary_key=True,
+                                 related_name="stats",
+                                 )
+    posts_count = models.PositiveIntegerField(default=0)
+    last_post = models.DateTimeField(null=True, blank=True)
+    recent_authors = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-last_post"]),
+            models.Index(fields=["-posts_count"]),
+            models.Index(fields=["-recent_authors"]),
+        ]
+
+
 class Comment(models.Model):
     """
         Description of the comment model.
@@ -111,4 +191,498 @@ class Follow(models.Model):
                                )
 
     class Meta:
-        unique_together = [["user", "author"]]
\ No newline at end of file
+        unique_together = [["user", "author"]]
+
+
+class Notification(models.Model):
+    """
+        Description of the notification model.
+        Parameters
+        -------
+        recipient: ForeignKey, link -> User
+            Who gets the notification
+        actor: ForeignKey, link -> User
+            Who made the event (author of the post or comment)
+        post: ForeignKey, link -> Post
+            Post the event is about
+        kind: CharField()
+            New post of a followed author or new comment on own post
+        created: DateTimeField()
+            Date of created
+        is_read: BooleanField()
+            Whether the recipient has seen it
+    """
+    POST = "post"
+    COMMENT = "comment"
+    KINDS = (
+        (POST, "Новая запись"),
+        (COMMENT, "Новый комментарий"),
+    )
+
+    recipient = models.ForeignKey(User,
+                                  on_delete=models.CASCADE,
+                                  related_name="notifications",
+                                  )
+    actor = models.ForeignKey(User,
+                              on_delete=models.CASCADE,
+                              related_name="+",
+                              )
+    post = models.ForeignKey(Post,
+                             on_delete=models.CASCADE,
+                             related_name="+",
+                             )
+    kind = models.CharField(max_length=10, choices=KINDS)
+    created = models.DateTimeField("created",
+                                   auto_now_add=True,
+                                   )
+    is_read = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ("-created",)
+        indexes = [
+            models.Index(fields=["recipient", "is_read"]),
+            models.Index(fields=["recipient", "-created"]),
+        ]
+
+
+class Digest(models.Model):
+    """
+        When the user got the last email digest.
+        Parameters
+        -------
+        user: OneToOneField, link -> User
+            Recipient of the digest
+        last_sent: DateTimeField()
+            Posts newer than this go to the next digest
+    """
+    user = models.OneToOneField(User,
+                                on_delete=models.CASCADE,
+                                primary_key=True,
+                                related_name="digest",
+                                )
+    last_sent = models.DateTimeField()
+
+
+class ArchivedPost(models.Model):
+    """
+    Old post moved out of the Post table by the archive_posts command.
+    Keeps the id of the original post, so its URL does not change.
+    Parameters
+    -------
+    Same as Post, plus
+    archived: DateTimeField()
+        Date of archiving
+    likes_count: PositiveIntegerField()
+        Likes at the time of archiving, archived posts can't be liked
+    revisions of the post move to ArchivedPostRevision
+    """
+    is_archived = True
+
+    id = models.IntegerField(primary_key=True)
+    text = models.TextField()
+    html = models.TextField(default="")
+    pub_date = models.DateTimeField("date published")
+    updated = models.DateTimeField("date updated")
+    author = models.ForeignKey(User,
+                               on_delete=models.CASCADE,
+                               related_name="archived_posts"
+                               )
+    group = models.ForeignKey(Group,
+                              on_delete=models.SET_NULL,
+                              blank=True,
+                              null=True,
+                              related_name="archived_posts"
+                              )
+    image = models.ImageField(upload_to='posts/',
+                              storage=content_storage,
+                              blank=True,
+                              null=True,
+                              )
+    archived = models.DateTimeField("date archived", auto_now_add=True)
+    likes_count = models.PositiveIntegerField(default=0)
+    revision = models.PositiveIntegerField(default=0, editable=False)
+
+    urls = cached_property(post_urls, name="urls")
+
+    class Meta:
+        ordering = ('-pub_date',)
+        indexes = [
+            models.Index(fields=["author", "-pub_date"]),
+        ]
+
+    def __str__(self):
+        return self.text[:50]
+
+    def get_absolute_url(self):
+        return self.urls["post"]
+
+
+class ArchivedComment(models.Model):
+    """Comment of an archived post, same fields as Comment"""
+    id = models.IntegerField(primary_key=True)
+    post = models.ForeignKey(ArchivedPost,
+                             on_delete=models.CASCADE,
+                             related_name="comments"
+                             )
+    author = models.ForeignKey(User,
+                               on_delete=models.CASCADE,
+                               related_name="archived_comments",
+                               )
+    text = models.TextField()
+    created = models.DateTimeField("created")
+
+
+class PostRevision(models.Model):
+    """
+        Version of the post before an edit, see posts/revisions.py
+        Parameters
+        -------
+        post: ForeignKey, link -> Post
+            The edited post
+        number: PositiveIntegerField()
+            Revision n is the post as it was before the n-th edit
+        created: DateTimeField()
+            When the version was replaced
+        is_snapshot: BooleanField()
+            body is the full text, not a delta
+        body: BinaryField()
+            zlib compressed text or delta against the next version
+        image: CharField()
+            Image of the version
+    """
+    post = models.ForeignKey(Post,
+                             on_delete=models.CASCADE,
+                             related_name="revisions"
+                             )
+    number = models.PositiveIntegerField()
+    created = models.DateTimeField("created",
+                                   auto_now_add=True,
+                                   )
+    is_snapshot = models.BooleanField(default=False)
+    body = models.BinaryField()
+    image = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        ordering = ("-number",)
+        unique_together = [["post", "number"]]
+
+
+class ArchivedPostRevision(models.Model):
+    """Revision of an archived post, same fields as PostRevision"""
+    post = models.ForeignKey(ArchivedPost,
+                             on_delete=models.CASCADE,
+                             related_name="revisions"
+                             )
+    number = models.PositiveIntegerField()
+    created = models.DateTimeField("created")
+    is_snapshot = models.BooleanField(default=False)
+    body = models.BinaryField()
+    image = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        ordering = ("-number",)
+        unique_together = [["post", "number"]]
+
+
+class Like(models.Model):
+    """
+        Like of a post, one per user and post.
+        Parameters
+        -------
+        user: ForeignKey, link -> User
+            Who liked
+        post: ForeignKey, link -> Post
+            What was liked
+        created: DateTimeField()
+            Date of created
+    """
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             related_name="likes",
+                             )
+    post = models.ForeignKey(Post,
+                             on_delete=models.CASCADE,
+                             related_name="likes",
+                             )
+    created = models.DateTimeField("created",
+                                   auto_now_add=True,
+                                   )
+
+    class Meta:
+        unique_together = [["user", "post"]]
+
+
+class LikeCounter(models.Model):
+    """
+        One shard of the like counter of a post, see posts/likes.py
+        Parameters
+        -------
+        post: ForeignKey, link -> Post
+            Counted post
+        shard: PositiveSmallIntegerField()
+            Number of the shard
+        count: IntegerField()
+            Part of the total, may be negative after unlikes
+    """
+    post = models.ForeignKey(Post,
+                             on_delete=models.CASCADE,
+                             related_name="like_counters",
+                             )
+    shard = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [["post", "shard"]]
+
+
+class Tag(models.Model):
+    """
+        Hashtag used in posts, lowercase without the '#'.
+        Parameters
+        -------
+        name: CharField()
+            The tag. Max length 100
+    """
+    name = models.CharField(max_length=100, unique=True)
+
+    def __str__(self):
+        return self.name
+
+
+class PostTag(models.Model):
+    """
+        Tag of a post, see posts/tags.py. pub_date is copied from the post
+        so the tag page is read from the (tag, -pub_date, -post) index only.
+        Parameters
+        -------
+        tag: ForeignKey, link -> Tag
+        post: ForeignKey, link -> Post
+        pub_date: DateTimeField()
+            Date of publication of the post
+    """
+    tag = models.ForeignKey(Tag,
+                            on_delete=models.CASCADE,
+                            related_name="post_tags",
+                            )
+    post = models.ForeignKey(Post,
+                             on_delete=models.CASCADE,
+                             related_name="post_tags",
+                             )
+    pub_date = models.DateTimeField("date published")
+
+    class Meta:
+        unique_together = [["post", "tag"]]
+        indexes = [
+            models.Index(fields=["tag", "-pub_date", "-post"]),
+        ]
+
+
+class Mention(models.Model):
+    """
+        @mention of a user in a post, see posts/tags.py
+        Parameters
+        -------
+        user: ForeignKey, link -> User
+            Who is mentioned
+        post: ForeignKey, link -> Post
+        pub_date: DateTimeField()
+            Date of publication of the post
+    """
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             related_name="mentions",
+                             )
+    post = models.ForeignKey(Post,
+                             on_delete=models.CASCADE,
+                             related_name="mentions",
+                             )
+    pub_date = models.DateTimeField("date published")
+
+    class Meta:
+        unique_together = [["post", "user"]]
+        indexes = [
+            models.Index(fields=["user", "-pub_date", "-post"]),
+        ]
+
+
+class ArchivedPostTag(models.Model):
+    """Tag of an archived post, same fields as PostTag"""
+    tag = models.ForeignKey(Tag,
+                            on_delete=models.CASCADE,
+                            related_name="archived_post_tags",
+                            )
+    post = models.ForeignKey(ArchivedPost,
+                             on_delete=models.CASCADE,
+                             related_name="post_tags",
+                             )
+    pub_date = models.DateTimeField("date published")
+
+    class Meta:
+        unique_together = [["post", "tag"]]
+        indexes = [
+            models.Index(fields=["tag", "-pub_date", "-post"]),
+        ]
+
+
+class ArchivedMention(models.Model):
+    """@mention in an archived post, same fields as Mention"""
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             related_name="archived_mentions",
+                             )
+    post = models.ForeignKey(ArchivedPost,
+                             on_delete=models.CASCADE,
+                             related_name="mentions",
+                             )
+    pub_date = models.DateTimeField("date published")
+
+    class Meta:
+        unique_together = [["post", "user"]]
+        indexes = [
+            models.Index(fields=["user", "-pub_date", "-post"]),
+        ]
+
+
+class Signature(models.Model):
+    """
+        MinHash signature of a post or comment text, see posts/spam.py
+        Parameters
+        -------
+        kind: CharField()
+            Post or comment
+        object_id: IntegerField()
+            Id of the post or comment
+        author: ForeignKey, link -> User
+            Author of the text
+        minhash: BinaryField()
+            SPAM_MINHASH_PERMUTATIONS uint32 minimums
+        created: DateTimeField()
+            Date of created
+    """
+    POST = "post"
+    COMMENT = "comment"
+    KINDS = (
+        (POST, "Запись"),
+        (COMMENT, "Комментарий"),
+    )
+
+    kind = models.CharField(max_length=10, choices=KINDS)
+    object_id = models.IntegerField()
+    author = models.ForeignKey(User,
+                               on_delete=models.CASCADE,
+                               related_name="+",
+                               )
+    minhash = models.BinaryField()
+    created = models.DateTimeField("created",
+                                   auto_now_add=True,
+                                   )
+
+    class Meta:
+        unique_together = [["kind", "object_id"]]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id}"
+
+
+class SignatureBand(models.Model):
+    """
+        One LSH band of a signature: texts sharing any bucket are
+        candidates for near-duplicates.
+        Parameters
+        -------
+        bucket: BigIntegerField()
+            Hash of the band number and its rows
+        signature: ForeignKey, link -> Signature
+    """
+    bucket = models.BigIntegerField(db_index=True)
+    signature = models.ForeignKey(Signature,
+                                  on_delete=models.CASCADE,
+                                  related_name="bands",
+                                  )
+
+
+class SpamFlag(models.Model):
+    """
+        Text found to be a near-duplicate of an earlier one.
+        Parameters
+        -------
+        signature: ForeignKey, link -> Signature
+            The new text
+        duplicate_of: ForeignKey, link -> Signature
+            The earlier text
+        similarity: FloatField()
+            Estimated Jaccard similarity of their shingles
+        same_author: BooleanField()
+            Whether both texts are by the same user
+        created: DateTimeField()
+            Date of created
+        resolved: BooleanField()
+            Checked by a moderator
+    """
+    signature = models.ForeignKey(Signature,
+                                  on_delete=models.CASCADE,
+                                  related_name="flags",
+                                  )
+    duplicate_of = models.ForeignKey(Signature,
+                                     on_delete=models.CASCADE,
+                                     related_name="+",
+                                     )
+    similarity = models.FloatField()
+    same_author = models.BooleanField()
+    created = models.DateTimeField("created",
+                                   auto_now_add=True,
+                                   )
+    resolved = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ("-created",)
+        indexes = [
+            models.Index(fields=["resolved", "-created"]),
+        ]
+
+
+class StoredFile(models.Model):
+    """
+        Reference count of a content-addressed image, see posts/storage.py
+        Parameters
+        -------
+        name: CharField()
+            Name of the file in the storage
+        refcount: PositiveIntegerField()
+            Number of posts, archived posts and revisions using it
+    """
+    name = models.CharField(max_length=255, primary_key=True)
+    refcount = models.PositiveIntegerField(default=1)
+
+    def __str__(self):
+        return self.name
+
+
+class AccountDeletion(models.Model):
+    """
+        Deletion of a user and all their content in batches, see
+        posts/accounts.py. Kept after the user is gone as a log.
+        Parameters
+        -------
+        user_id: IntegerField()
+            Id of the deleted user
+        username: CharField()
+            Name of the deleted user
+        requested: DateTimeField()
+            Date of the request
+        stage: CharField()
+            What is being deleted now
+        deleted: PositiveIntegerField()
+            Rows deleted so far
+        finished: DateTimeField()
+            Date the user was deleted
+    """
+    user_id = models.IntegerField(primary_key=True)
+    username = models.CharField(max_length=150)
+    requested = models.DateTimeField("requested", auto_now_add=True)
+    stage = models.CharField(max_length=30, blank=True)
+    deleted = models.PositiveIntegerField(default=0)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.username
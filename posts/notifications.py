@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Comment, Follow, Notification, Post
+from .utils import chunked
+
+UNREAD_KEY = "notifications:unread:{}"
+
+
+def unread_count(user):
+    """Unread counter for the nav badge, one indexed COUNT on a miss"""
+    key = UNREAD_KEY.format(user.pk)
+    count = cache.get(key)
+    if count is None:
+        count = Notification.objects.filter(recipient=user,
+                                            is_read=False).count()
+        cache.set(key, count, settings.NOTIFICATIONS_COUNT_TIMEOUT)
+    return count
+
+
+def reset_unread(user_ids):
+    cache.delete_many([UNREAD_KEY.format(pk) for pk in user_ids])
+
+
+def notify_followers(post_id):
+    """Fan out a new post to all followers of its author in batches"""
+    post = Post.objects.filter(pk=post_id).values("author_id").first()
+    if post is None:
+        return
+    author_id = post["author_id"]
+    followers = (Follow.objects.filter(author_id=author_id)
+                 .values_list("user_id", flat=True)
+                 .iterator())
+    for batch in chunked(followers, settings.NOTIFICATIONS_BATCH_SIZE):
+        Notification.objects.bulk_create(
+            Notification(recipient_id=user_id,
+                         actor_id=author_id,
+                         post_id=post_id,
+                         kind=Notification.POST)
+            for user_id in batch
+        )
+        reset_unread(batch)
+
+
+def notify_post_author(comment_id):
+    comment = (Comment.objects.filter(pk=comment_id)
+               .values("author_id", "post_id", "post__author_id")
+               .first())
+    if comment is None or comment["author_id"] == comment["post__author_id"]:
+        return
+    Notification.objects.create(recipient_id=comment["post__author_id"],
+                                actor_id=comment["author_id"],
+                                post_id=comment["post_id"],
+                                kind=Notification.COMMENT)
+    reset_unread([comment["post__author_id"]])
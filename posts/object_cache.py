@@ -0,0 +1,147 @@
+"""
+Read-through cache for point lookups of Post, Group and User.
+
+Objects are cached by primary key, lookups by a unique field
+(username, slug) only cache the primary key and are verified against
+the object, so a renamed user or group can not be returned for its old
+name. Keys carry OBJECT_CACHE_VERSION and are dropped on save/delete
+(see posts/signals.py). Cached copies never contain related objects,
+those are resolved through the cache as well.
+"""
+import copy
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404
+
+from .models import Group, Post, User
+
+
+def object_key(model, pk):
+    return (f"obj:{settings.OBJECT_CACHE_VERSION}:"
+            f"{model._meta.label_lower}:{pk}")
+
+
+def lookup_key(model, field, value):
+    return (f"obj:{settings.OBJECT_CACHE_VERSION}:"
+            f"{model._meta.label_lower}:{field}:{value}")
+
+
+def detached(obj):
+    """Copy of the object without cached relations"""
+    clean = copy.copy(obj)
+    clean._state = copy.copy(obj._state)
+    clean._state.fields_cache = {}
+    clean.__dict__.pop("_prefetched_objects_cache", None)
+    return clean
+
+
+def get_many(model, pks):
+    """{pk: object} for the existing objects, one DB query for all misses"""
+    keys = {object_key(model, pk): pk for pk in pks}
+    found = {keys[key]: obj for key, obj in cache.get_many(keys).items()}
+    missing = [pk for pk in keys.values() if pk not in found]
+    if missing:
+        loaded = model._default_manager.in_bulk(missing)
+        cache.set_many({object_key(model, pk): detached(obj)
+                        for pk, obj in loaded.items()},
+                       settings.OBJECT_CACHE_TIMEOUT)
+        found.update(loaded)
+    return found
+
+
+def get(model, pk):
+    return get_many(model, [pk]).get(pk)
+
+
+def get_by(model, field, value):
+    key = lookup_key(model, field, value)
+    pk = cache.get(key)
+    if pk is not None:
+        obj = get(model, pk)
+        if obj is not None and getattr(obj, field) == value:
+            return obj
+    obj = model._default_manager.filter(**{field: value}).first()
+    if obj is not None:
+        cache.set_many({key: obj.pk,
+                        object_key(model, obj.pk): detached(obj)},
+                       settings.OBJECT_CACHE_TIMEOUT)
+    return obj
+
+
+# unique fields used by get_by()
+LOOKUP_FIELDS = {
+    User: "username",
+    Group: "slug",
+}
+
+
+def invalidate(model, pks):
+    cache.delete_many([object_key(model, pk) for pk in pks])
+
+
+def invalidate_instance(instance):
+    """Drop the object and its lookup, e.g. a new user takes a free name"""
+    model = type(instance)
+    keys = [object_key(model, instance.pk)]
+    if model in LOOKUP_FIELDS:
+        field = LOOKUP_FIELDS[model]
+        keys.append(lookup_key(model, field, getattr(instance, field)))
+    cache.delete_many(keys)
+
+
+def get_user_or_404(username):
+    user = get_by(User, "username", username)
+    if user is None or not user.is_active:
+        raise Http404("No User matches the given query.")
+    return user
+
+
+def get_group_or_404(slug):
+    group = get_by(Group, "slug", slug)
+    if group is None:
+        raise Http404("No Group matches the given query.")
+    return group
+
+
+def get_post(post_id, username=None):
+    """Post with author and group, None if missing or of another author"""
+    post = get(Post, post_id)
+    if post is None:
+        return None
+    post.author = get(User, post.author_id)
+    if post.author is None or not post.author.is_active:
+        return None
+    if username is not None and post.author.username != username:
+        return None
+    if post.group_id is not None:
+        post.group = get(Group, post.group_id)
+    return post
+
+
+def get_posts(post_ids):
+    """
+    {pk: post} with authors and groups for a page of ids, like
+    get_post() but with one cache read per model. Posts of inactive
+    authors are left out.
+    """
+    posts = get_many(Post, post_ids)
+    authors = get_many(User, {post.author_id for post in posts.values()})
+    groups = get_many(Group, {post.group_id for post in posts.values()}
+                      - {None})
+    found = {}
+    for pk, post in posts.items():
+        post.author = authors.get(post.author_id)
+        if post.author is None or not post.author.is_active:
+            continue
+        if post.group_id is not None:
+            post.group = groups.get(post.group_id)
+        found[pk] = post
+    return found
+
+
+def get_post_or_404(post_id, username=None):
+    post = get_post(post_id, username)
+    if post is None:
+        raise Http404("No Post matches the given query.")
+    return post
@@ -0,0 +1,93 @@
+"""
+HTML of posts, rendered once when the post is saved.
+
+Post.html holds the escaped text with line breaks, clickable URLs,
+@mention links to existing users and #tag links, so templates output it
+as is instead of running linebreaksbr and urlize on every page view.
+
+URLs of a post are built from format strings reversed once per URL name
+(url_format) instead of resolving the URLconf for each post on a page.
+"""
+import re
+from functools import lru_cache
+from urllib.parse import quote
+
+from django.contrib.auth import get_user_model
+from django.urls import NoReverseMatch, reverse
+from django.utils.html import format_html, urlize
+from django.utils.text import normalize_newlines
+
+# @name or #name not glued to a word, URL path or HTML entity
+TOKEN_RE = re.compile(r"(?<![\w/&#@.=?+%:-])([@#])(\w[\w.+-]*\w|\w)")
+
+# what reverse() leaves unquoted in path arguments
+SAFE_CHARS = "!$&'()*+,;=/~:@"
+
+PLACEHOLDERS = {"username": "yatubeusernameplaceholder",
+                "post_id": 8071964253,
+                "name": "yatubenameplaceholder"}
+
+
+@lru_cache(maxsize=None)
+def url_format(name, *params):
+    """reverse() result with {param} fields in place of the arguments"""
+    url = reverse(name, args=[PLACEHOLDERS[param] for param in params])
+    url = url.replace("{", "{{").replace("}", "}}")
+    for param in params:
+        url = url.replace(str(PLACEHOLDERS[param]), "{%s}" % param)
+    return url
+
+
+def fast_reverse(url_name, **kwargs):
+    return url_format(url_name, *kwargs).format(**{
+        param: quote(str(value), safe=SAFE_CHARS)
+        for param, value in kwargs.items()
+    })
+
+
+def tag_url(name):
+    """Link of a #tag, None while tag pages are not routed"""
+    try:
+        return fast_reverse("tag", name=name.lower())
+    except NoReverseMatch:
+        return None
+
+
+def post_urls(post):
+    """URLs shown with a post, see Post.urls"""
+    username = post.author.username
+    urls = {"post": fast_reverse("post", username=username, post_id=post.pk),
+            "profile": fast_reverse("profile", username=username)}
+    for name in ("post_edit", "post_history", "post_like", "post_unlike"):
+        urls[name[len("post_"):]] = fast_reverse(
+            name, username=username, post_id=post.pk)
+    return urls
+
+
+def render_html(text):
+    """Escaped post text with line breaks, URL, @mention and #tag links"""
+    text = normalize_newlines(text)
+    parts = TOKEN_RE.split(text)
+    mentioned = set(parts[2::3][i] for i, sign in enumerate(parts[1::3])
+                    if sign == "@")
+    users = set(get_user_model().objects
+                .filter(username__in=mentioned)
+                .values_list("username", flat=True)) if mentioned else set()
+
+    html = []
+    for i, part in enumerate(parts):
+        if i % 3 == 0:
+            html.append(urlize(part, nofollow=True, autoescape=True))
+        elif i % 3 == 1:
+            sign, name = part, parts[i + 1]
+            url = None
+            if sign == "@" and name in users:
+                url = fast_reverse("profile", username=name)
+            elif sign == "#":
+                url = tag_url(name)
+            if url is None:
+                html.append(format_html("{}{}", sign, name))
+            else:
+                html.append(format_html('<a href="{}">{}{}</a>',
+                                        url, sign, name))
+    return "".join(html).replace("\n", "<br>")
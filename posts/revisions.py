@@ -0,0 +1,108 @@
+"""
+Compact edit history of posts.
+
+Every edit stores the replaced version as a reverse delta: the operations
+that turn the new text back into the old one. The current text lives in
+Post, so the latest versions are the cheapest to rebuild. Every
+POST_REVISION_SNAPSHOT_EVERY-th revision stores the full text instead,
+so rebuilding any version applies at most that many deltas.
+
+A delta is a JSON list of line ranges [start, end] copied from the newer
+text and literal strings, compressed with zlib.
+"""
+import difflib
+import json
+import zlib
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Post, PostRevision
+
+
+def make_delta(new, old):
+    new_lines = new.splitlines(keepends=True)
+    old_lines = old.splitlines(keepends=True)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, new_lines, old_lines,
+                                      autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif tag in ("replace", "insert"):
+            ops.append("".join(old_lines[j1:j2]))
+    return ops
+
+
+def apply_delta(new, ops):
+    new_lines = new.splitlines(keepends=True)
+    return "".join(
+        op if isinstance(op, str) else "".join(new_lines[op[0]:op[1]])
+        for op in ops
+    )
+
+
+def record_revision(post):
+    """
+    Save the version the edited post replaces. Must be called in the
+    transaction that saves the post, before saving it; sets
+    post.revision.
+
+    The replaced version and its number come from the values the post
+    was loaded with, so an edit costs one INSERT. If the copy is stale,
+    another edit has already taken that number and the unique
+    (post, number) constraint refuses the row; then the counter is
+    bumped in the database and the stored version read back under the
+    row lock, so concurrent edits still get consecutive numbers and
+    deltas against the version that is really stored.
+    """
+    loaded = getattr(post, "_loaded_values", {})
+    if {"text", "image", "revision"} <= loaded.keys():
+        try:
+            with transaction.atomic():
+                return save_revision(post, loaded["revision"] + 1,
+                                     loaded["text"], loaded["image"])
+        except IntegrityError:
+            pass
+    Post.objects.filter(pk=post.pk).update(revision=F("revision") + 1)
+    stored = Post.objects.values("text", "image", "revision").get(pk=post.pk)
+    return save_revision(post, stored["revision"], stored["text"],
+                         stored["image"])
+
+
+def save_revision(post, number, old_text, old_image):
+    is_snapshot = number % settings.POST_REVISION_SNAPSHOT_EVERY == 0
+    if is_snapshot:
+        payload = old_text
+    else:
+        payload = json.dumps(make_delta(post.text, old_text),
+                             ensure_ascii=False)
+    revision = PostRevision.objects.create(
+        post=post,
+        number=number,
+        is_snapshot=is_snapshot,
+        body=zlib.compress(payload.encode()),
+        image=old_image or "",
+    )
+    post.revision = number
+    return revision
+
+
+def text_at(post, number):
+    """Text of the post as it was before the edit `number`"""
+    snapshot = (post.revisions.filter(number__gte=number, is_snapshot=True)
+                .order_by("number")
+                .values_list("number", flat=True)
+                .first())
+    revisions = (post.revisions.filter(number__gte=number,
+                                       number__lte=snapshot or post.revision)
+                 .order_by("-number"))
+    text = post.text
+    for revision in revisions:
+        payload = zlib.decompress(revision.body).decode()
+        if revision.is_snapshot:
+            text = payload
+        else:
+            text = apply_delta(text, json.loads(payload))
+    return text
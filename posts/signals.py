@@ -0,0 +1,119 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import group_stats, object_cache, spam, stored_files, tags
+from .archive import is_archiving
+from .feeds import bump_feed_versions, post_scopes
+from .models import (ArchivedPost, ArchivedPostRevision, Comment, Group,
+                     GroupStats, Post, PostRevision, Signature, User)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_feeds(sender, instance, **kwargs):
+    """Reset cached feeds the post belongs (or belonged) to"""
+    loaded = getattr(instance, "_loaded_values", {})
+    group_ids = {instance.group_id, loaded.get("group_id")} - {None}
+    bump_feed_versions(post_scopes(instance.author_id, group_ids))
+
+
+@receiver(post_save, sender=Post)
+def update_group_stats_on_save(sender, instance, created, **kwargs):
+    old_group_id = getattr(instance, "_loaded_values", {}).get("group_id")
+    if created:
+        old_group_id = None
+    elif old_group_id == instance.group_id:
+        return
+    if old_group_id is not None:
+        group_stats.post_removed(old_group_id, instance.pub_date)
+    if instance.group_id is not None:
+        group_stats.post_added(instance.group_id, instance.pub_date)
+
+
+@receiver(post_delete, sender=Post)
+def update_group_stats_on_delete(sender, instance, **kwargs):
+    # archived posts still count, see GroupStats
+    if instance.group_id is not None and not is_archiving():
+        group_stats.post_removed(instance.group_id, instance.pub_date)
+
+
+@receiver(post_save, sender=Post)
+def update_tags(sender, instance, created, **kwargs):
+    old_text = getattr(instance, "_loaded_values", {}).get("text")
+    if created:
+        old_text = None
+    elif old_text == instance.text:
+        return
+    tags.sync_post(instance, old_text)
+
+
+@receiver(post_save, sender=Post)
+def count_image_references(sender, instance, created, **kwargs):
+    old_image = getattr(instance, "_loaded_values", {}).get("image")
+    if created:
+        old_image = None
+    if old_image != instance.image.name:
+        stored_files.acquire(instance.image.name)
+        stored_files.release(old_image)
+
+
+@receiver(post_delete, sender=Post)
+def release_image(sender, instance, **kwargs):
+    # the archived copy keeps the reference
+    if not is_archiving():
+        stored_files.release(instance.image.name)
+
+
+@receiver(post_delete, sender=ArchivedPost)
+def release_archived_image(sender, instance, **kwargs):
+    stored_files.release(instance.image.name)
+
+
+@receiver(post_delete, sender=ArchivedPost)
+def update_group_stats_on_archived_delete(sender, instance, **kwargs):
+    if instance.group_id is not None:
+        group_stats.post_removed(instance.group_id, instance.pub_date)
+
+
+@receiver(post_save, sender=PostRevision)
+def acquire_revision_image(sender, instance, created, **kwargs):
+    if created:
+        stored_files.acquire(instance.image)
+
+
+@receiver(post_delete, sender=PostRevision)
+def release_revision_image(sender, instance, **kwargs):
+    # the archived copy keeps the reference
+    if not is_archiving():
+        stored_files.release(instance.image)
+
+
+@receiver(post_delete, sender=ArchivedPostRevision)
+def release_archived_revision_image(sender, instance, **kwargs):
+    stored_files.release(instance.image)
+
+
+@receiver(post_delete, sender=Post)
+def forget_post_signature(sender, instance, **kwargs):
+    spam.forget(Signature.POST, instance.pk)
+
+
+@receiver(post_delete, sender=Comment)
+def forget_comment_signature(sender, instance, **kwargs):
+    spam.forget(Signature.COMMENT, instance.pk)
+
+
+@receiver(post_save, sender=Group)
+def create_group_stats(sender, instance, created, **kwargs):
+    if created:
+        GroupStats.objects.create(group=instance)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_object_cache(sender, instance, **kwargs):
+    object_cache.invalidate_instance(instance)
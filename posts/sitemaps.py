@@ -0,0 +1,197 @@
+"""
+Sitemaps of posts, archived posts, profiles, groups and flatpages.
+
+Big tables are split into pages by primary key ranges: page N holds the
+objects with (N - 1) * limit <= pk < N * limit. A page is an index range
+scan streamed with .iterator(), so neither the index nor any page needs
+COUNT(*), OFFSET or the whole table in memory. Ranges emptied by deleted
+or archived rows are left out of the index and answer 404. Rendered files are kept
+in settings.SITEMAP_ROOT and regenerated when older than
+settings.SITEMAP_CACHE_TIMEOUT (or by the build_sitemaps command).
+"""
+import itertools
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.flatpages.sitemaps import FlatPageSitemap
+from django.contrib.sitemaps import Sitemap
+from django.contrib.sites.shortcuts import get_current_site
+from django.core.paginator import EmptyPage, PageNotAnInteger
+from django.http import FileResponse, Http404
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.functional import cached_property
+
+from .models import ArchivedPost, Group, Post, User
+
+
+class KeysetPage:
+    def __init__(self, object_list):
+        self.object_list = object_list
+
+
+class KeysetPaginator:
+    """Fixed-size primary key ranges instead of LIMIT/OFFSET pages"""
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+
+    @cached_property
+    def page_range(self):
+        """
+        Numbers of the ranges holding at least one object. Ranges left
+        empty by deleted or archived rows are skipped with one index
+        seek per listed page.
+        """
+        pks = self.queryset.order_by("pk").values_list("pk", flat=True)
+        numbers = []
+        start = 0
+        while True:
+            pk = pks.filter(pk__gte=start).first()
+            if pk is None:
+                return numbers
+            numbers.append(pk // self.per_page + 1)
+            start = numbers[-1] * self.per_page
+
+    def page(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger("That page number is not an integer")
+        start = (number - 1) * self.per_page
+        objects = (self.queryset
+                   .filter(pk__gte=start, pk__lt=start + self.per_page)
+                   .order_by("pk")
+                   .iterator())
+        first = next(objects, None)
+        if first is None:
+            raise EmptyPage("That page contains no results")
+        return KeysetPage(itertools.chain([first], objects))
+
+
+class KeysetSitemap(Sitemap):
+
+    @property
+    def limit(self):
+        return settings.SITEMAP_LIMIT
+
+    @property
+    def paginator(self):
+        return KeysetPaginator(self.items(), self.limit)
+
+
+class PostSitemap(KeysetSitemap):
+    changefreq = "weekly"
+
+    def items(self):
+        return (Post.objects.select_related("author")
+                .filter(author__is_active=True)
+                .only("pk", "updated", "author__username"))
+
+    def lastmod(self, post):
+        return post.updated
+
+
+class ArchivedPostSitemap(PostSitemap):
+    """Archived posts keep their ids and URLs and are still served"""
+    changefreq = "yearly"
+
+    def items(self):
+        return (ArchivedPost.objects.select_related("author")
+                .filter(author__is_active=True)
+                .only("pk", "updated", "author__username"))
+
+
+class ProfileSitemap(KeysetSitemap):
+    changefreq = "daily"
+
+    def items(self):
+        return User.objects.filter(is_active=True).only("pk", "username")
+
+    def location(self, user):
+        return reverse("profile", args=[user.username])
+
+
+class GroupSitemap(KeysetSitemap):
+    changefreq = "daily"
+
+    def items(self):
+        return Group.objects.only("pk", "slug")
+
+    def location(self, group):
+        return reverse("group", args=[group.slug])
+
+
+SITEMAPS = {
+    "posts": PostSitemap(),
+    "archive": ArchivedPostSitemap(),
+    "profiles": ProfileSitemap(),
+    "groups": GroupSitemap(),
+    "flatpages": FlatPageSitemap(),
+}
+
+
+def render_index(site, protocol):
+    urls = []
+    for section, sitemap in SITEMAPS.items():
+        location = "%s://%s%s" % (
+            protocol, site.domain,
+            reverse("sitemap_section", kwargs={"section": section}))
+        urls.extend(location if page == 1 else f"{location}?p={page}"
+                    for page in sitemap.paginator.page_range)
+    return render_to_string("sitemap_index.xml", {"sitemaps": urls})
+
+
+def render_section(section, page, site, protocol):
+    urls = SITEMAPS[section].get_urls(page=page, site=site,
+                                      protocol=protocol)
+    return render_to_string("sitemap.xml", {"urlset": urls})
+
+
+def sitemap_path(name):
+    return os.path.join(settings.SITEMAP_ROOT, f"{name}.xml")
+
+
+def write_sitemap(name, content):
+    """Atomic write, readers never see a half written file"""
+    os.makedirs(settings.SITEMAP_ROOT, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=settings.SITEMAP_ROOT, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp, sitemap_path(name))
+
+
+def cached_sitemap(name, render):
+    path = sitemap_path(name)
+    try:
+        fresh = (time.time() - os.path.getmtime(path)
+                 < settings.SITEMAP_CACHE_TIMEOUT)
+    except OSError:
+        fresh = False
+    if not fresh:
+        write_sitemap(name, render())
+    return FileResponse(open(path, "rb"), content_type="application/xml")
+
+
+def index(request):
+    site = get_current_site(request)
+    return cached_sitemap("index",
+                          lambda: render_index(site, request.scheme))
+
+
+def section(request, section):
+    if section not in SITEMAPS:
+        raise Http404(f"No sitemap available for section: {section}")
+    page = request.GET.get("p", "1")
+    if not page.isdigit():
+        raise Http404("Page is not an integer")
+    site = get_current_site(request)
+    try:
+        return cached_sitemap(
+            f"{section}-{int(page)}",
+            lambda: render_section(section, page, site, request.scheme))
+    except (EmptyPage, PageNotAnInteger):
+        raise Http404(f"Page {page} empty")
@@ -0,0 +1,132 @@
+"""
+Near-duplicate detection of posts and comments with MinHash and LSH.
+
+A text is normalized and cut into character shingles of SPAM_SHINGLE_SIZE.
+Its signature holds, for each of SPAM_MINHASH_PERMUTATIONS hash functions
+(a * x + b) mod p, the minimum over the shingles; the share of equal
+minimums of two signatures estimates the Jaccard similarity of the texts.
+
+The signature is split into SPAM_LSH_BANDS bands; each band is hashed to
+a bucket stored in SignatureBand. Texts sharing a bucket are the only
+candidates compared, so a check costs a single indexed lookup whatever
+the number of stored texts. Candidates at or above SPAM_SIMILARITY are
+flagged with a SpamFlag for moderators; nothing is blocked.
+
+An edited text is indexed again: its bands are replaced and the
+unresolved flags of the old text dropped. A deleted text is forgotten
+together with its bands and every flag pointing at it.
+"""
+import hashlib
+import zlib
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .models import Comment, Post, Signature, SignatureBand, SpamFlag
+
+MERSENNE_PRIME = (1 << 61) - 1
+
+
+@lru_cache(maxsize=None)
+def permutations(size):
+    # fixed seed: signatures must be comparable across processes and runs
+    random = np.random.RandomState(20200202)
+    a = random.randint(1, MERSENNE_PRIME, size=size, dtype=np.uint64)
+    b = random.randint(0, MERSENNE_PRIME, size=size, dtype=np.uint64)
+    return a, b
+
+
+def shingles(text):
+    words = " ".join(text.lower().split())
+    size = settings.SPAM_SHINGLE_SIZE
+    return {words[i:i + size]
+            for i in range(max(len(words) - size + 1, 1))}
+
+
+def minhash(text):
+    """Signature of the text as an array of uint32"""
+    a, b = permutations(settings.SPAM_MINHASH_PERMUTATIONS)
+    hashes = np.fromiter(
+        (zlib.crc32(shingle.encode()) for shingle in shingles(text)),
+        dtype=np.uint64)
+    # a * x + b wraps around 2**64 on purpose, it only has to mix well
+    values = (np.outer(hashes, a) + b) % np.uint64(MERSENNE_PRIME)
+    return values.min(axis=0).astype(np.uint32)
+
+
+def buckets(signature):
+    rows = len(signature) // settings.SPAM_LSH_BANDS
+    result = []
+    for band in range(settings.SPAM_LSH_BANDS):
+        digest = hashlib.blake2b(
+            signature[band * rows:(band + 1) * rows].tobytes(),
+            digest_size=8, person=band.to_bytes(2, "big")).digest()
+        result.append(int.from_bytes(digest, "big", signed=True))
+    return result
+
+
+def similarity(first, second):
+    return float(np.mean(first == second))
+
+
+def index(kind, object_id, author_id, text, flag=True):
+    """Store the signature of the text, flag its near-duplicates"""
+    if len(text.strip()) < settings.SPAM_MIN_LENGTH:
+        forget(kind, object_id)
+        return []
+    signature = minhash(text)
+    bands = buckets(signature)
+    flags = []
+    with transaction.atomic():
+        if flag:
+            candidates = (Signature.objects
+                          .filter(bands__bucket__in=bands)
+                          .exclude(kind=kind, object_id=object_id)
+                          .distinct()
+                          .order_by("-pk")
+                          [:settings.SPAM_MAX_CANDIDATES])
+            for candidate in candidates:
+                score = similarity(
+                    signature,
+                    np.frombuffer(bytes(candidate.minhash), dtype=np.uint32))
+                if score >= settings.SPAM_SIMILARITY:
+                    flags.append((candidate, score))
+        previous = (Signature.objects
+                    .filter(kind=kind, object_id=object_id)
+                    .values_list("minhash", flat=True).first())
+        stored, created = Signature.objects.update_or_create(
+            kind=kind, object_id=object_id,
+            defaults={"author_id": author_id,
+                      "minhash": signature.tobytes()})
+        if not created:
+            stored.bands.all().delete()
+            if bytes(previous) != signature.tobytes():
+                stored.flags.filter(resolved=False).delete()
+        SignatureBand.objects.bulk_create(
+            SignatureBand(bucket=bucket, signature=stored)
+            for bucket in bands)
+        return SpamFlag.objects.bulk_create(
+            SpamFlag(signature=stored,
+                     duplicate_of=candidate,
+                     similarity=score,
+                     same_author=candidate.author_id == author_id)
+            for candidate, score in flags)
+
+
+def forget(kind, object_id):
+    """Drop the signature of a deleted text, its bands and flags"""
+    Signature.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def check_post(post_id):
+    post = Post.objects.filter(pk=post_id).first()
+    if post is not None:
+        index(Signature.POST, post.pk, post.author_id, post.text)
+
+
+def check_comment(comment_id):
+    comment = Comment.objects.filter(pk=comment_id).first()
+    if comment is not None:
+        index(Signature.COMMENT, comment.pk, comment.author_id, comment.text)
@@ -0,0 +1,70 @@
+"""
+Content-addressed storage of post images.
+
+An upload is hashed with SHA-256 while it is streamed to a temporary file
+and then stored as <upload_to>/ab/cd/<sha256><ext>. Identical uploads get
+the same name, so they share one file on disk and one set of sorl
+thumbnails (thumbnails are keyed by the name of the source). Storing a
+duplicate touches the existing file, so it counts as a new upload for
+media_gc.
+
+Files are shared between posts, archived posts and revisions, so they
+are reference counted in StoredFile, see posts/stored_files.py.
+"""
+import hashlib
+import os
+import re
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASHED_NAME_RE = re.compile(r"(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}"
+                            r"(\.\w+)?$")
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # the name is derived from the content in _save()
+        return name
+
+    def _save(self, name, content):
+        prefix, ext = os.path.dirname(name), os.path.splitext(name)[1]
+        directory = self.path(prefix)
+        os.makedirs(directory, exist_ok=True)
+        temporary = os.path.join(directory, f".upload-{uuid.uuid4().hex}")
+        digest = hashlib.sha256()
+        try:
+            fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+                         0o666)
+            with os.fdopen(fd, "wb") as f:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    f.write(chunk)
+            key = digest.hexdigest()
+            name = "/".join(filter(None, [prefix, key[:2], key[2:4],
+                                          key + ext.lower()]))
+            full_path = self.path(name)
+            try:
+                # a fresh mtime keeps media_gc --min-age off the file
+                # until the new reference is saved
+                os.utime(full_path)
+            except FileNotFoundError:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(temporary, self.file_permissions_mode)
+                os.replace(temporary, full_path)
+            else:
+                os.remove(temporary)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        return name
+
+    def is_content_addressed(self, name):
+        return bool(name) and HASHED_NAME_RE.search(name) is not None
+
+
+content_storage = ContentAddressedStorage()
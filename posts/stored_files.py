@@ -0,0 +1,47 @@
+"""
+Reference counts of content-addressed images, see posts/storage.py.
+
+Every post, archived post and revision using an image holds a reference.
+When the last one is released, the file and its thumbnails are deleted
+after the transaction commits, unless an upload of the same content has
+taken a new reference in the meantime: the count is checked again under
+a row lock right before the delete. Files stored under their upload names
+before content addressing are not counted; media_gc takes care of them.
+"""
+from django.db import transaction
+from django.db.models import F
+from sorl.thumbnail import delete as delete_with_thumbnails
+
+from .models import StoredFile
+from .storage import content_storage
+
+
+def acquire(name):
+    if not content_storage.is_content_addressed(name):
+        return
+    counted = StoredFile.objects.filter(name=name).update(
+        refcount=F("refcount") + 1)
+    if counted:
+        return
+    _, created = StoredFile.objects.get_or_create(name=name)
+    if not created:
+        StoredFile.objects.filter(name=name).update(refcount=F("refcount") + 1)
+
+
+def release(name):
+    if not content_storage.is_content_addressed(name):
+        return
+    released = StoredFile.objects.filter(name=name, refcount__gt=0).update(
+        refcount=F("refcount") - 1)
+    if released:
+        transaction.on_commit(lambda: delete_unused(name))
+
+
+def delete_unused(name):
+    with transaction.atomic():
+        unused = (StoredFile.objects.select_for_update()
+                  .filter(name=name, refcount=0).first())
+        if unused is None:
+            return
+        delete_with_thumbnails(name)
+        unused.delete()
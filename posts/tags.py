@@ -0,0 +1,58 @@
+"""
+Index of #tags and @mentions of posts.
+
+Tags and mentions are parsed from the text when a post is saved and kept
+in PostTag/Mention, so tag pages and "mentions of me" are read from
+their (tag|user, -pub_date, -post) indexes instead of scanning texts.
+On edit only the difference between the old and the new text is written.
+"""
+from .models import Mention, PostTag, Tag, User
+from .rendering import TOKEN_RE
+
+MAX_TAG_LENGTH = Tag._meta.get_field("name").max_length
+
+
+def parse(text):
+    """Tags (lowercase) and mentioned usernames of the text"""
+    tags, usernames = set(), set()
+    for sign, name in TOKEN_RE.findall(text or ""):
+        if sign == "#":
+            if len(name) <= MAX_TAG_LENGTH:
+                tags.add(name.lower())
+        else:
+            usernames.add(name)
+    return tags, usernames
+
+
+def add_tags(post, names):
+    Tag.objects.bulk_create((Tag(name=name) for name in names),
+                            ignore_conflicts=True)
+    PostTag.objects.bulk_create(
+        (PostTag(tag_id=tag_id, post_id=post.pk, pub_date=post.pub_date)
+         for tag_id in Tag.objects.filter(name__in=names)
+         .values_list("pk", flat=True)),
+        ignore_conflicts=True)
+
+
+def add_mentions(post, usernames):
+    Mention.objects.bulk_create(
+        (Mention(user_id=user_id, post_id=post.pk, pub_date=post.pub_date)
+         for user_id in User.objects.filter(username__in=usernames)
+         .values_list("pk", flat=True)),
+        ignore_conflicts=True)
+
+
+def sync_post(post, old_text=None):
+    """Write the tags and mentions that differ from those of old_text"""
+    tags, usernames = parse(post.text)
+    old_tags, old_usernames = parse(old_text)
+    if tags - old_tags:
+        add_tags(post, tags - old_tags)
+    if old_tags - tags:
+        PostTag.objects.filter(post=post,
+                               tag__name__in=old_tags - tags).delete()
+    if usernames - old_usernames:
+        add_mentions(post, usernames - old_usernames)
+    if old_usernames - usernames:
+        Mention.objects.filter(
+            post=post, user__username__in=old_usernames - usernames).delete()
@@ -0,0 +1,108 @@
+"""
+Minimal deferred execution without an external queue.
+
+Work passed to `defer()` during a request is collected until the
+response has been handed to the client (the request_finished signal)
+and then submitted to a pool of DEFERRED_WORKERS background threads,
+so neither the user nor the WSGI worker thread waits for it. With
+DEFERRED_WORKERS = 0 it runs in the worker thread right after the
+response, as before.
+
+The pool lives in the web process: tasks still waiting when the process
+exits are lost, and a burst of them shares that process' CPU. Anything
+that has to survive a restart needs a real queue. Outside of a request
+(shell, management commands) work runs as soon as the current
+transaction commits.
+"""
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.signals import request_finished, request_started
+from django.db import connections, transaction
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def defer(func, *args, **kwargs):
+    transaction.on_commit(callback(func, args, kwargs))
+
+
+def defer_once(func, *args):
+    """
+    defer() that skips the call when the same one already waits for the
+    current transaction to commit, for recounts that need to run once
+    however many rows changed
+    """
+    key = (func, args)
+    waiting = transaction.get_connection().run_on_commit
+    if any(getattr(call, "key", None) == key for _, call in waiting):
+        return
+    call = callback(func, args, {})
+    call.key = key
+    transaction.on_commit(call)
+
+
+def callback(func, args, kwargs):
+    call = functools.partial(func, *args, **kwargs)
+    queue = getattr(_local, "queue", None)
+    if queue is None:
+        return call
+    return lambda: queue.append(call)
+
+
+@receiver(request_started)
+def start_queue(sender, **kwargs):
+    _local.queue = []
+
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(settings.DEFERRED_WORKERS,
+                                           thread_name_prefix="deferred")
+        return _executor
+
+
+def join():
+    """Wait for the work already submitted, e.g. before a command exits"""
+    global _executor
+    with _executor_lock:
+        pool, _executor = _executor, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+
+def run(calls):
+    for call in calls:
+        try:
+            call()
+        except Exception:
+            logger.exception("Deferred task %r failed", call.func)
+
+
+def run_in_background(calls):
+    try:
+        run(calls)
+    finally:
+        # the pool thread's own connections
+        connections.close_all()
+
+
+@receiver(request_finished)
+def run_queue(sender, **kwargs):
+    queue, _local.queue = getattr(_local, "queue", None), None
+    if not queue:
+        return
+    if settings.DEFERRED_WORKERS:
+        executor().submit(run_in_background, queue)
+    else:
+        run(queue)
@@ -1,9 +1,40 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core import mail
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.http import Http404
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from sorl.thumbnail import get_thumbnail
+
+from yatube import hashers
+from yatube.profiler import make_token
+from yatube.ratelimit import take_tokens
 
-from .models import Follow, Group, Post, User
+from . import object_cache, spam, tasks
+from .archive import archive_batch
+from .follows import follow_many
+from .likes import like
+from .models import (AccountDeletion, ArchivedPost, Comment, Digest, Follow,
+                     Group, GroupStats, LikeCounter, Mention, Notification,
+                     Post, PostRevision, PostTag, Signature, SpamFlag,
+                     StoredFile, User)
+from .revisions import record_revision, text_at
+from .signals import invalidate_feeds
 
 
 class PostTest(TestCase):
@@ -277,3 +308,1262 @@ class FollowTest(TestCase):
                     )
         )
         self.assertNotContains(response_code, text_comment2)
+
+
+@override_settings(RATELIMITS={"new_post": {"user": "2/m"}})
+class RateLimitTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="spammer",
+                                             password="12345")
+        self.client.force_login(self.user)
+
+    def test_new_post_throttled(self):
+        print("Test 3-1. Too many posts get 429")
+        url = reverse("new_post")
+        for i in range(2):
+            response = self.client.post(url, {"text": f"spam {i}"})
+            self.assertEqual(response.status_code, 302)
+        response = self.client.post(url, {"text": "spam 3"})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response["Retry-After"]), 0)
+        self.assertEqual(response["Content-Type"], "text/plain; charset=utf-8")
+        self.assertEqual(Post.objects.filter(author=self.user).count(), 2)
+        # reading the form is not limited
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    @override_settings(RATELIMITS={"new_post": {"user": "5/m", "ip": "1/m"}})
+    def test_denied_request_takes_no_tokens(self):
+        print("Test 3-2. A bucket that denies keeps the others untouched")
+        url = reverse("new_post")
+        self.client.post(url, {"text": "first"})
+        response = self.client.post(url, {"text": "second"})
+        self.assertEqual(response.status_code, 429)
+        window = int(time.time() // 60)
+        counted = cache.get_many(f"rl:new_post:u:{self.user.pk}:{w}"
+                                 for w in (window - 1, window))
+        self.assertEqual(sum(counted.values()), 1)
+
+    def test_last_token_taken_once(self):
+        print("Test 3-3. Concurrent requests can't share the last token")
+        results = []
+        threads = [threading.Thread(
+            target=lambda: results.append(take_tokens([("rl:t", "1/m")])))
+            for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(0), 1)
+
+
+@override_settings(DEFERRED_WORKERS=0)
+class NotificationTest(TransactionTestCase):
+    """on_commit callbacks need real commits"""
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="author",
+                                               password="12345")
+        self.reader = User.objects.create_user(username="reader",
+                                               password="12345")
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_fan_out_and_read(self):
+        print("Test 4-1. Followers get notified about new posts")
+        self.author_client.post(reverse("new_post"), {"text": "news"})
+        post = Post.objects.get(text="news")
+        self.assertTrue(Notification.objects.filter(
+            recipient=self.reader, post=post, kind=Notification.POST,
+            is_read=False).exists())
+        response = self.reader_client.get(reverse("follow_index"))
+        self.assertContains(response, "badge")
+        self.reader_client.get(reverse("notifications"))
+        self.assertFalse(self.reader.notifications.filter(
+            is_read=False).exists())
+        response = self.reader_client.get(reverse("follow_index"))
+        self.assertNotContains(response, "badge")
+
+    def test_comment_notifies_author(self):
+        print("Test 4-2. Post author is notified about comments")
+        post = Post.objects.create(text="text", author=self.author)
+        self.reader_client.post(
+            reverse("add_comment", args=[self.author.username, post.id]),
+            {"text": "nice"})
+        self.assertEqual(self.author.notifications.get().actor, self.reader)
+
+    def test_read_shown_page_only(self):
+        print("Test 4-3. Only the notifications shown are marked as read")
+        post = Post.objects.create(text="text", author=self.author)
+        Notification.objects.bulk_create(
+            Notification(recipient=self.reader, actor=self.author, post=post,
+                         kind=Notification.POST)
+            for _ in range(25))
+        self.reader_client.get(reverse("notifications"))
+        self.assertEqual(self.reader.notifications.filter(
+            is_read=False).count(), 5)
+
+    @override_settings(DEFERRED_WORKERS=1)
+    def test_deferred_in_background(self):
+        print("Test 4-4. Deferred work runs in a background thread")
+        done = threading.Event()
+        threads = []
+
+        def work():
+            threads.append(threading.current_thread())
+            done.set()
+
+        tasks.start_queue(None)
+        tasks.defer(work)
+        tasks.run_queue(None)
+        self.assertTrue(done.wait(5))
+        self.assertIsNot(threads[0], threading.current_thread())
+
+
+class DigestTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username="author",
+                                               email="author@mail.ru")
+        self.reader = User.objects.create_user(username="reader",
+                                               email="reader@mail.ru")
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def test_digest(self):
+        print("Test 5-1. Digest contains new posts of followed authors")
+        post = Post.objects.create(text="digest post", author=self.author)
+        call_command("send_digest", stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["reader@mail.ru"])
+        self.assertIn(post.text, mail.outbox[0].body)
+        self.assertIn(f"/author/{post.id}/", mail.outbox[0].body)
+        self.assertEqual(Digest.objects.count(), 2)
+        # nothing new since the last digest
+        call_command("send_digest", stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_large_batch_size(self):
+        print("Test 5-2. Batches stay below the SQLite variables limit")
+        User.objects.bulk_create(User(username=f"many{i}",
+                                      email=f"many{i}@mail.ru")
+                                 for i in range(1000))
+        Follow.objects.bulk_create(Follow(user=user, author=self.author)
+                                   for user in User.objects.filter(
+                                       username__startswith="many"))
+        Post.objects.create(text="digest post", author=self.author)
+        call_command("send_digest", batch_size=5000, stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1001)
+
+
+class FeedTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="writer")
+        self.group = Group.objects.create(slug="feed_group",
+                                          title="Feed group",
+                                          description="Feeds")
+        self.post = Post.objects.create(text="first feed post",
+                                        author=self.user,
+                                        group=self.group)
+
+    def test_feeds(self):
+        print("Test 6-1. RSS and Atom feeds")
+        for url in (reverse("feed_rss"),
+                    reverse("feed_atom"),
+                    reverse("group_feed_rss", args=[self.group.slug]),
+                    reverse("group_feed_atom", args=[self.group.slug]),
+                    reverse("profile_feed_rss", args=[self.user.username]),
+                    reverse("profile_feed_atom", args=[self.user.username])):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertContains(response, "first feed post")
+                self.assertContains(response, self.post.get_absolute_url())
+
+    def test_cached_and_conditional(self):
+        print("Test 6-2. Feeds are cached and honor conditional GET")
+        url = reverse("group_feed_rss", args=[self.group.slug])
+        response = self.client.get(url)
+        with self.assertNumQueries(0):
+            cached = self.client.get(url)
+            not_modified = self.client.get(
+                url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(not_modified.status_code, 304)
+        # a new post in the group changes the feed
+        Post.objects.create(text="second feed post", author=self.user,
+                            group=self.group)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertContains(response, "second feed post")
+
+    def test_invalidation_without_lookups(self):
+        print("Test 6-3. Feed invalidation needs no author or group query")
+        url = reverse("profile_feed_rss", args=[self.user.username])
+        etag = self.client.get(url)["ETag"]
+        post = Post.objects.get(pk=self.post.pk)
+        with self.assertNumQueries(0):
+            invalidate_feeds(Post, post)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse("profile_feed_rss",
+                                           args=["nobody"]))
+        self.assertEqual(response.status_code, 404)
+        self.assertIsNone(cache.get("feeds:version:None"))
+
+
+@override_settings(SITEMAP_LIMIT=2, SITEMAP_ROOT=tempfile.mkdtemp())
+class SitemapTest(TestCase):
+    def setUp(self):
+        # rendered files would outlive the posts of another test
+        shutil.rmtree(settings.SITEMAP_ROOT, ignore_errors=True)
+        self.client = Client()
+        self.user = User.objects.create_user(username="mapper")
+        self.posts = [Post.objects.create(text=f"post {i}", author=self.user)
+                      for i in range(5)]
+
+    def test_sitemap_index_and_pages(self):
+        print("Test 7-1. Sitemap index is split into bounded pages")
+        response = self.client.get(reverse("sitemap"))
+        content = b"".join(response.streaming_content).decode()
+        self.assertIn("sitemap-posts.xml?p=2", content)
+        found = []
+        page = 1
+        while f"sitemap-posts.xml?p={page + 1}" in content:
+            page += 1
+        for number in range(1, page + 1):
+            response = self.client.get(
+                reverse("sitemap_section", args=["posts"]), {"p": number})
+            found.append(b"".join(response.streaming_content).decode())
+        for post in self.posts:
+            self.assertTrue(any(post.get_absolute_url() in xml
+                                for xml in found))
+        self.assertTrue(all(xml.count("<url>") <= 2 for xml in found))
+        self.assertIn("<lastmod>", found[-1])
+        response = self.client.get(
+            reverse("sitemap_section", args=["posts"]), {"p": page + 1})
+        self.assertEqual(response.status_code, 404)
+
+    def test_empty_ranges_are_skipped(self):
+        print("Test 7-2. Pages emptied by deleted posts are not listed")
+        for post in self.posts[:4]:
+            post.delete()
+        last = self.posts[-1]
+        response = self.client.get(reverse("sitemap"))
+        content = b"".join(response.streaming_content).decode()
+        number = last.pk // settings.SITEMAP_LIMIT + 1
+        self.assertEqual(content.count("sitemap-posts.xml"), 1)
+        self.assertIn(f"sitemap-posts.xml?p={number}", content)
+        response = self.client.get(
+            reverse("sitemap_section", args=["posts"]), {"p": number})
+        xml = b"".join(response.streaming_content).decode()
+        self.assertEqual(xml.count("<url>"), 1)
+        self.assertIn(last.get_absolute_url(), xml)
+        response = self.client.get(
+            reverse("sitemap_section", args=["posts"]), {"p": 1})
+        self.assertEqual(response.status_code, 404)
+
+    def test_archived_posts_are_listed(self):
+        print("Test 7-3. Archived posts stay in the sitemap")
+        archive_batch([post.pk for post in self.posts[:3]])
+        response = self.client.get(reverse("sitemap"))
+        index = b"".join(response.streaming_content).decode()
+        found = ""
+        for location in re.findall(r"<loc>[^<]*(/sitemap-[^<]*)</loc>",
+                                   index):
+            response = self.client.get(location.replace("&amp;", "&"))
+            found += b"".join(response.streaming_content).decode()
+        for post in self.posts:
+            self.assertIn(post.get_absolute_url(), found)
+
+
+@override_settings(ADMIN_BATCH_SIZE=2)
+class AdminTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.admin = User.objects.create_superuser(
+            username="admin", email="admin@yatube.ru", password="12345")
+        self.client.force_login(self.admin)
+        self.user = User.objects.create_user(username="writer")
+        self.posts = [Post.objects.create(text=f"admin post {i}",
+                                          author=self.user)
+                      for i in range(5)]
+        Comment.objects.create(post=self.posts[0], author=self.user,
+                               text="comment")
+        Follow.objects.create(user=self.admin, author=self.user)
+
+    def test_changelists(self):
+        print("Test 8-1. Admin changelists with input filters")
+        for model in ("post", "comment", "follow"):
+            with self.subTest(model=model):
+                url = reverse(f"admin:posts_{model}_changelist")
+                response = self.client.get(url, {"author": "writer"})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.context["cl"].result_count,
+                                 {"post": 5, "comment": 1,
+                                  "follow": 1}[model])
+
+    def test_delete_in_batches(self):
+        print("Test 8-2. Admin deletes in batches")
+        response = self.client.post(
+            reverse("admin:posts_post_changelist"),
+            {"action": "delete_in_batches",
+             "_selected_action": [post.pk for post in self.posts[:3]]})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertFalse(Comment.objects.exists())
+
+    def test_remove_from_group(self):
+        print("Test 8-3. Removing posts from a group updates its stats")
+        group = Group.objects.create(slug="moderated", title="Moderated",
+                                     description="-")
+        for post in self.posts[:3]:
+            post.group = group
+            post.save()
+        self.client.post(
+            reverse("admin:posts_post_changelist"),
+            {"action": "remove_from_group",
+             "_selected_action": [post.pk for post in self.posts[:2]]})
+        stats = GroupStats.objects.get(group=group)
+        self.assertEqual(stats.posts_count, 1)
+        self.assertEqual(stats.last_post,
+                         Post.objects.get(pk=self.posts[2].pk).pub_date)
+
+
+@override_settings(DEFERRED_WORKERS=0)
+class GroupStatsTest(TransactionTestCase):
+    """recent_authors is recounted on commit"""
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username="writer")
+        self.other = User.objects.create_user(username="reader")
+        self.quiet = Group.objects.create(slug="quiet", title="Quiet",
+                                          description="-")
+        self.busy = Group.objects.create(slug="busy", title="Busy",
+                                         description="-")
+
+    def test_stats_follow_posts(self):
+        print("Test 9-1. Group stats are updated on post changes")
+        first = Post.objects.create(text="1", author=self.user,
+                                    group=self.busy)
+        second = Post.objects.create(text="2", author=self.other,
+                                     group=self.busy)
+        stats = GroupStats.objects.get(group=self.busy)
+        self.assertEqual((stats.posts_count, stats.recent_authors), (2, 2))
+        self.assertEqual(stats.last_post, second.pub_date)
+
+        second.group = self.quiet
+        second.save()
+        second.save()
+        stats.refresh_from_db()
+        self.assertEqual((stats.posts_count, stats.recent_authors), (1, 1))
+        self.assertEqual(stats.last_post, first.pub_date)
+        self.assertEqual(
+            GroupStats.objects.get(group=self.quiet).posts_count, 1)
+
+        first.delete()
+        stats.refresh_from_db()
+        self.assertEqual((stats.posts_count, stats.last_post), (0, None))
+
+    def test_recount_once_per_transaction(self):
+        print("Test 9-3. Recent authors are recounted once per commit")
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                for i in range(3):
+                    Post.objects.create(text=str(i), author=self.user,
+                                        group=self.busy)
+                stats = GroupStats.objects.get(group=self.busy)
+                self.assertEqual(stats.recent_authors, 0)
+        recounts = [query for query in queries.captured_queries
+                    if "DISTINCT" in query["sql"]]
+        self.assertEqual(len(recounts), 1)
+        stats.refresh_from_db()
+        self.assertEqual((stats.posts_count, stats.recent_authors), (3, 1))
+        response = self.client.get(reverse("group_list"))
+        self.assertContains(response, "Авторов за 30 дн.")
+
+    def test_directory(self):
+        print("Test 9-2. Group directory in one query")
+        Post.objects.create(text="1", author=self.user, group=self.busy)
+        self.client.get(reverse("group_list"))
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("group_list"),
+                                       {"sort": "posts"})
+        self.assertEqual(list(response.context["groups"]),
+                         [self.busy, self.quiet])
+
+
+class ArchiveTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username="oldtimer")
+        self.group = Group.objects.create(slug="old", title="Old",
+                                          description="-")
+        self.old = Post.objects.create(text="old post", author=self.user,
+                                       group=self.group)
+        Post.objects.filter(pk=self.old.pk).update(
+            pub_date=self.old.pub_date.replace(year=2000))
+        Comment.objects.create(post=self.old, author=self.user,
+                               text="old comment")
+        self.new = Post.objects.create(text="new post", author=self.user)
+
+    def test_archive_and_fallback(self):
+        print("Test 10-1. Old posts are archived and still readable")
+        call_command("archive_posts", stdout=StringIO())
+        self.assertFalse(Post.objects.filter(pk=self.old.pk).exists())
+        archived = ArchivedPost.objects.get(pk=self.old.pk)
+        self.assertEqual(archived.comments.get().text, "old comment")
+        self.assertEqual(
+            GroupStats.objects.get(group=self.group).posts_count, 1)
+
+        response = self.client.get(
+            reverse("post", args=[self.user.username, self.old.pk]))
+        self.assertContains(response, "old post")
+        self.assertContains(response, "old comment")
+
+        response = self.client.get(
+            reverse("profile", args=[self.user.username]))
+        self.assertContains(response, "old post")
+        self.assertContains(response, "new post")
+        self.assertEqual(response.context["posts_count"], 2)
+
+    def test_archive_keeps_likes_and_tags(self):
+        print("Test 10-2. Likes, tags and mentions survive archiving")
+        reader = User.objects.create_user(username="reader")
+        post = Post.objects.get(pk=self.old.pk)
+        post.text = "#vintage for @reader"
+        post.save()
+        like(reader, post.pk)
+        call_command("archive_posts", stdout=StringIO())
+        archived = ArchivedPost.objects.get(pk=post.pk)
+        self.assertEqual(archived.likes_count, 1)
+
+        response = self.client.get(reverse("tag", args=["vintage"]))
+        self.assertEqual(list(response.context["page"]), [archived])
+        self.assertContains(response, "&#9825; 1")
+        self.client.force_login(reader)
+        response = self.client.get(reverse("mentions"))
+        self.assertEqual(list(response.context["page"]), [archived])
+
+
+@override_settings(POST_REVISION_SNAPSHOT_EVERY=3)
+class RevisionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="editor")
+        self.client.force_login(self.user)
+        self.post = Post.objects.create(text="line 1\nline 2",
+                                        author=self.user)
+
+    def test_history(self):
+        print("Test 11-1. Every version of an edited post can be rebuilt")
+        url = reverse("post_edit", args=[self.user.username, self.post.id])
+        versions = [self.post.text]
+        for i in range(7):
+            text = versions[-1].replace(f"line {i % 2 + 1}", f"edit {i}")
+            text += f"\nline {i + 3}"
+            self.client.post(url, {"text": text})
+            versions.append(text)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.text, versions[-1])
+        self.assertEqual(self.post.revision, 7)
+        self.assertEqual(
+            list(self.post.revisions.filter(is_snapshot=True)
+                 .values_list("number", flat=True)), [6, 3])
+        for number in range(1, 8):
+            self.assertEqual(text_at(self.post, number), versions[number - 1])
+
+        history = reverse("post_history",
+                          args=[self.user.username, self.post.id])
+        response = self.client.get(history, {"rev": 2})
+        self.assertContains(response, "edit 0")
+        self.assertNotContains(response, "line 5")
+
+    def test_revision_is_one_insert(self):
+        print("Test 11-3. Recording a revision of a fresh copy is one INSERT")
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = "line 1\nline two"
+        with CaptureQueriesContext(connection) as queries:
+            record_revision(post)
+        statements = [query["sql"].split()[0] for query in queries]
+        self.assertEqual([s for s in statements if s != "SAVEPOINT"
+                          and s != "RELEASE"], ["INSERT"])
+        self.assertEqual(post.revision, 1)
+
+    def test_unchanged_edit_has_no_revision(self):
+        url = reverse("post_edit", args=[self.user.username, self.post.id])
+        self.client.post(url, {"text": self.post.text})
+        self.assertFalse(PostRevision.objects.exists())
+
+    def test_stale_copies_and_archive(self):
+        print("Test 11-2. Edits of stale copies are numbered in turn, "
+              "history moves to the archive")
+        first = Post.objects.get(pk=self.post.pk)
+        second = Post.objects.get(pk=self.post.pk)
+        for post, text in ((first, "first edit"), (second, "second edit")):
+            post.text = text
+            record_revision(post)
+            post.save()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.revision, 2)
+        self.assertEqual(text_at(self.post, 2), "first edit")
+        self.assertEqual(text_at(self.post, 1), "line 1\nline 2")
+
+        archive_batch([self.post.pk])
+        archived = ArchivedPost.objects.get(pk=self.post.pk)
+        self.assertEqual(text_at(archived, 1), "line 1\nline 2")
+        response = self.client.get(
+            reverse("post_history", args=[self.user.username, self.post.pk]),
+            {"rev": 2})
+        self.assertContains(response, "first edit")
+
+
+class LikeTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="star")
+        self.post = Post.objects.create(text="viral", author=self.author)
+        self.clients = []
+        for i in range(3):
+            client = Client()
+            client.force_login(User.objects.create_user(username=f"fan{i}"))
+            self.clients.append(client)
+
+    def test_likes(self):
+        print("Test 12-1. Likes are idempotent and counted on pages")
+        like_url = reverse("post_like", args=["star", self.post.id])
+        for client in self.clients:
+            client.post(like_url)
+            client.post(like_url)
+        self.clients[0].post(reverse("post_unlike",
+                                     args=["star", self.post.id]))
+        self.assertEqual(self.post.likes.count(), 2)
+        self.assertEqual(
+            sum(LikeCounter.objects.values_list("count", flat=True)), 2)
+        response = self.clients[1].get(reverse("profile", args=["star"]))
+        post = response.context["page"][0]
+        self.assertEqual((post.likes_count, post.liked), (2, True))
+        response = self.clients[0].get(reverse("profile", args=["star"]))
+        self.assertFalse(response.context["page"][0].liked)
+
+    def test_like_requires_post(self):
+        response = self.clients[0].get(
+            reverse("post_like", args=["star", self.post.id]))
+        self.assertEqual(response.status_code, 405)
+
+
+class LikeFragmentTest(TransactionTestCase):
+    """The like version changes on commit"""
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="star")
+        self.posts = [Post.objects.create(text=f"viral {i}",
+                                          author=self.author)
+                      for i in range(11)]
+        self.client.force_login(User.objects.create_user(username="fan"))
+
+    def test_cached_index(self):
+        print("Test 12-2. The cached index shows own likes and every page")
+        self.client.get(reverse("index"))
+        self.client.post(reverse("post_like",
+                                 args=["star", self.posts[-1].pk]))
+        response = self.client.get(reverse("index"))
+        self.assertContains(response, "&#9829; 1")
+        response = self.client.get(reverse("index"), {"page": 2})
+        self.assertContains(response, "viral 0")
+        self.assertNotContains(response, "viral 10")
+
+
+class ObjectCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="cached")
+        self.group = Group.objects.create(slug="cached", title="Cached",
+                                          description="-")
+        self.post = Post.objects.create(text="cached post",
+                                        author=self.user, group=self.group)
+
+    def test_warm_lookups(self):
+        print("Test 13-1. Primary objects come from the cache")
+        self.client.get(reverse("post", args=["cached", self.post.id]))
+        self.client.get(reverse("profile", args=["cached"]))
+        self.client.get(reverse("group", args=["cached"]))
+        with self.assertNumQueries(0):
+            object_cache.get_post_or_404(self.post.id, "cached")
+            object_cache.get_user_or_404("cached")
+            object_cache.get_group_or_404("cached")
+
+    def test_invalidation(self):
+        print("Test 13-2. Saved objects are not served stale")
+        object_cache.get_user_or_404("cached")
+        object_cache.get_post_or_404(self.post.id)
+        self.user.username = "renamed"
+        self.user.save()
+        self.post.text = "edited"
+        self.post.save()
+        with self.assertRaises(Http404):
+            object_cache.get_user_or_404("cached")
+        self.assertEqual(object_cache.get_user_or_404("renamed"), self.user)
+        self.assertEqual(object_cache.get_post(self.post.id).text, "edited")
+        self.assertIsNone(object_cache.get_post(self.post.id, "cached"))
+        self.post.delete()
+        self.assertIsNone(object_cache.get_post(self.post.id))
+
+    def test_pages_of_ids(self):
+        print("Test 13-3. Tag pages read their posts from the cache")
+        self.post.text = "cached #news"
+        self.post.save()
+        url = reverse("tag", args=["news"])
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(list(response.context["page"]), [self.post])
+        self.assertEqual(response.context["page"][0].group, self.group)
+        self.assertFalse([query for query in queries
+                          if 'FROM "posts_post"' in query["sql"]])
+
+
+class ProfilerTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = tempfile.mkdtemp()
+        self.settings = override_settings(PROFILER_ROOT=self.root,
+                                          PROFILER_INTERVAL=0.0001,
+                                          PROFILER_KEEP=2)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        self.addCleanup(shutil.rmtree, self.root)
+        self.user = User.objects.create_user(username="staff",
+                                             password="12345")
+        Post.objects.create(text="profiled", author=self.user)
+
+    def test_signed_header(self):
+        print("Test 14-1. Signed requests are profiled and rotated")
+        # a full uncached page, long enough to be sampled inside the view
+        Post.objects.bulk_create(Post(text=f"profiled {i}", author=self.user)
+                                 for i in range(9))
+        for i in range(3):
+            cache.clear()
+            response = self.client.get(reverse("index"),
+                                       HTTP_X_PROFILE=make_token())
+            self.assertIn("X-Profile", response)
+        profiles = os.listdir(os.path.join(self.root, "index"))
+        self.assertEqual(len(profiles), 2)
+        with open(os.path.join(self.root, response["X-Profile"])) as f:
+            lines = [line.rsplit(" ", 1) for line in f]
+        self.assertTrue(all(int(count) > 0 for _, count in lines))
+        self.assertTrue(any("views.py:index" in stack for stack, _ in lines))
+
+        response = self.client.get(reverse("index"), HTTP_X_PROFILE="forged")
+        self.assertNotIn("X-Profile", response)
+
+    def test_staff_flag(self):
+        print("Test 14-2. Only staff can profile with a query flag")
+        self.client.force_login(self.user)
+        url = reverse("index") + "?profile=1"
+        self.assertNotIn("X-Profile", self.client.get(url))
+        self.user.is_staff = True
+        self.user.save()
+        self.assertIn("X-Profile", self.client.get(url))
+
+    @override_settings(PROFILER_SAMPLE_RATE=1)
+    def test_sampled_quietly(self):
+        print("Test 14-3. Sampled profiles are not announced to the client")
+        response = self.client.get(reverse("index"))
+        self.assertNotIn("X-Profile", response)
+        self.assertEqual(len(os.listdir(os.path.join(self.root, "index"))),
+                         1)
+
+
+class TracingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        self.path = os.path.join(root, "traces.jsonl")
+        self.settings = override_settings(TRACING_ENABLED=True,
+                                          TRACING_FILE=self.path)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        user = User.objects.create_user(username="traced", password="12345")
+        for i in range(3):
+            Post.objects.create(text=f"traced {i}", author=user)
+        image = SimpleUploadedFile(
+            name="traced.gif",
+            content=(b"GIF89a\x01\x00\x01\x00\x00\x00\x00!\xf9\x04"
+                     b"\x01\n\x00\x01\x00,\x00\x00\x00\x00\x01\x00"
+                     b"\x01\x00\x00\x02\x02L\x01\x00;"),
+            content_type="image/gif",
+        )
+        Post.objects.create(text="with image", author=user, image=image)
+
+    def test_slow_requests_are_kept(self):
+        print("Test 15-1. Slow requests are traced, fast ones dropped")
+        with override_settings(TRACING_SLOW_MS=60 * 1000):
+            self.assertEqual(Client().get(reverse("index")).status_code, 200)
+        self.assertFalse(os.path.exists(self.path))
+
+        cache.clear()
+        with override_settings(TRACING_SLOW_MS=0):
+            Client().get(reverse("index"))
+        with open(self.path) as f:
+            trace = json.loads(f.readline())
+        self.assertEqual(trace["view"], "index")
+        self.assertEqual(trace["status"], 200)
+        self.assertGreater(trace["summary"]["db"]["count"], 0)
+        self.assertGreater(trace["summary"]["cache"]["count"], 0)
+        self.assertEqual(trace["summary"]["thumbnail"]["count"], 1)
+        templates = {span["name"] for span in trace["spans"]
+                     if span["kind"] == "template"}
+        self.assertIn("includes/post_item.html", templates)
+        item = next(span for span in trace["spans"]
+                    if span["name"] == "includes/post_item.html")
+        self.assertEqual(trace["spans"][item["parent"]]["kind"], "template")
+
+
+class PostHtmlTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="writer",
+                                             password="12345")
+
+    def test_rendered_on_save(self):
+        print("Test 16-1. Post text is rendered to HTML once on save")
+        post = Post.objects.create(
+            author=self.user,
+            text="<b>hi</b> @writer @nobody\nsee https://example.com #tag")
+        self.assertEqual(
+            post.html,
+            '&lt;b&gt;hi&lt;/b&gt; <a href="/writer/">@writer</a> @nobody'
+            '<br>see <a href="https://example.com" rel="nofollow">'
+            'https://example.com</a> <a href="/tag/tag/">#tag</a>')
+        response = self.client.get(reverse("index"))
+        self.assertContains(response, post.html, html=False)
+        self.assertContains(response, f'href="{post.urls["post"]}"')
+
+        Post.objects.filter(pk=post.pk).update(html="")
+        call_command("render_posts", stdout=StringIO())
+        post.refresh_from_db()
+        self.assertIn('<a href="/writer/">@writer</a>', post.html)
+
+    def test_fast_reverse(self):
+        print("Test 16-2. Cached URL formats match reverse()")
+        user = User.objects.create_user(username="пользо.ва+тель")
+        post = Post.objects.create(author=user, text="text")
+        args = [user.username, post.pk]
+        self.assertEqual(post.urls, {
+            "post": reverse("post", args=args),
+            "profile": reverse("profile", args=args[:1]),
+            "edit": reverse("post_edit", args=args),
+            "history": reverse("post_history", args=args),
+            "like": reverse("post_like", args=args),
+            "unlike": reverse("post_unlike", args=args),
+        })
+
+
+class TagTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="tagger",
+                                             password="12345")
+        self.reader = User.objects.create_user(username="reader",
+                                               password="12345")
+        self.client.force_login(self.user)
+
+    def test_tags_follow_edits(self):
+        print("Test 17-1. Tags are indexed and follow post edits")
+        post = Post.objects.create(author=self.user,
+                                   text="#Django and #python")
+        self.assertIn(f'href="{reverse("tag", args=["django"])}"', post.html)
+        response = self.client.get(reverse("tag", args=["django"]))
+        self.assertContains(response, "#Django")
+
+        self.client.post(reverse("post_edit", args=["tagger", post.pk]),
+                         {"text": "#django and #sqlite"})
+        self.assertEqual(
+            set(PostTag.objects.filter(post=post)
+                .values_list("tag__name", flat=True)),
+            {"django", "sqlite"})
+        response = self.client.get(reverse("tag", args=["python"]))
+        self.assertEqual(len(response.context["page"]), 0)
+        self.assertEqual(
+            self.client.get(reverse("tag", args=["unknown"])).status_code,
+            404)
+
+    def test_mentions(self):
+        print("Test 17-2. Mentioned users see the post on their page")
+        post = Post.objects.create(author=self.user,
+                                   text="hi @reader and @ghost")
+        self.assertEqual(list(Mention.objects.values_list("user", "post")),
+                         [(self.reader.pk, post.pk)])
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse("mentions"))
+        self.assertEqual(list(response.context["page"]), [post])
+        post.text = "bye"
+        post.save()
+        self.assertFalse(Mention.objects.exists())
+
+
+class SpamTest(TestCase):
+    SPAM = ("Earn 500 dollars a day from home, no experience needed! "
+            "Click the link in my profile and start today")
+
+    def setUp(self):
+        cache.clear()
+        self.bot = User.objects.create_user(username="bot1")
+        self.other_bot = User.objects.create_user(username="bot2")
+
+    def test_near_duplicates_are_flagged(self):
+        print("Test 18-1. Near-duplicate texts are flagged")
+        first = Post.objects.create(author=self.bot, text=self.SPAM)
+        spam.check_post(first.pk)
+        unrelated = Post.objects.create(
+            author=self.other_bot,
+            text="Went hiking in the mountains last weekend, lovely views")
+        spam.check_post(unrelated.pk)
+        self.assertFalse(SpamFlag.objects.exists())
+
+        variant = Post.objects.create(
+            author=self.other_bot,
+            text=self.SPAM.replace("500", "700").replace("today", "now!"))
+        spam.check_post(variant.pk)
+        flag = SpamFlag.objects.get()
+        self.assertEqual(flag.signature.object_id, variant.pk)
+        self.assertEqual(flag.duplicate_of.object_id, first.pk)
+        self.assertFalse(flag.same_author)
+        self.assertGreaterEqual(flag.similarity, 0.7)
+
+    def test_backfill(self):
+        print("Test 18-2. Existing posts are indexed by a command")
+        Post.objects.create(author=self.bot, text=self.SPAM)
+        Post.objects.create(author=self.bot, text=self.SPAM + "!")
+        Post.objects.create(author=self.bot, text="too short")
+        call_command("index_signatures", stdout=StringIO())
+        self.assertEqual(Signature.objects.count(), 2)
+        self.assertFalse(SpamFlag.objects.exists())
+        call_command("index_signatures", "--flag", stdout=StringIO())
+        self.assertTrue(SpamFlag.objects.filter(same_author=True).exists())
+
+    def test_edits_and_deletes(self):
+        print("Test 18-3. Signatures follow edits and deletes")
+        first = Post.objects.create(author=self.bot, text=self.SPAM)
+        spam.check_post(first.pk)
+        variant = Post.objects.create(author=self.other_bot,
+                                      text=self.SPAM + "!")
+        spam.check_post(variant.pk)
+        self.assertTrue(SpamFlag.objects.filter(
+            signature__object_id=variant.pk).exists())
+
+        variant.text = ("Went hiking in the mountains last weekend, "
+                        "lovely views and no signal at all")
+        variant.save()
+        spam.check_post(variant.pk)
+        self.assertFalse(SpamFlag.objects.exists())
+        self.assertEqual(Signature.objects.count(), 2)
+
+        comment = Comment.objects.create(post=first, author=self.other_bot,
+                                         text=self.SPAM)
+        spam.check_comment(comment.pk)
+        self.assertTrue(SpamFlag.objects.exists())
+        first.delete()
+        self.assertFalse(SpamFlag.objects.exists())
+        self.assertEqual(list(Signature.objects.values_list("object_id",
+                                                            flat=True)),
+                         [variant.pk])
+
+
+class MediaGcTest(TestCase):
+    GIF = (b"GIF89a\x01\x00\x01\x00\x00\x00\x00!\xf9\x04\x01\n\x00"
+           b"\x01\x00,\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02L"
+           b"\x01\x00;")
+
+    def setUp(self):
+        cache.clear()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.settings = override_settings(MEDIA_ROOT=self.root)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        self.user = User.objects.create_user(username="uploader")
+
+    def post_with_thumbnail(self, name):
+        post = Post.objects.create(
+            author=self.user, text=name,
+            # trailing bytes keep the images distinct for the storage
+            image=SimpleUploadedFile(name, self.GIF + name.encode(),
+                                     "image/gif"))
+        thumbnail = get_thumbnail(post.image, "1x1", upscale=False)
+        return post, post.image.name, thumbnail.name
+
+    def age(self, *names):
+        for name in names:
+            path = os.path.join(self.root, name)
+            os.utime(path, (0, 0))
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(self.root, name))
+
+    def test_orphans_are_deleted(self):
+        print("Test 19-1. Orphaned originals and thumbnails are deleted")
+        kept, kept_image, kept_thumbnail = self.post_with_thumbnail("a.gif")
+        gone, gone_image, gone_thumbnail = self.post_with_thumbnail("b.gif")
+        gone.delete()
+        os.makedirs(os.path.join(self.root, "posts"), exist_ok=True)
+        for name in ("posts/stray.gif", "posts/young.gif"):
+            with open(os.path.join(self.root, name), "wb") as f:
+                f.write(self.GIF)
+        self.age(kept_image, kept_thumbnail, gone_image, gone_thumbnail,
+                 "posts/stray.gif")
+
+        out = StringIO()
+        call_command("media_gc", "--dry-run", stdout=out)
+        self.assertIn("Would delete 3 files", out.getvalue())
+        self.assertTrue(self.exists(gone_image))
+
+        out = StringIO()
+        call_command("media_gc", "--rate", "0", stdout=out)
+        # the source and the thumbnail record of the deleted post
+        self.assertIn("and 2 thumbnail records", out.getvalue())
+        for name in (gone_image, gone_thumbnail, "posts/stray.gif"):
+            self.assertFalse(self.exists(name), name)
+        for name in (kept_image, kept_thumbnail, "posts/young.gif"):
+            self.assertTrue(self.exists(name), name)
+
+
+class ContentStorageTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.settings = override_settings(MEDIA_ROOT=self.root)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        self.user = User.objects.create_user(username="uploader",
+                                             password="12345")
+
+    def upload(self, name):
+        return Post.objects.create(
+            author=self.user, text=name,
+            image=SimpleUploadedFile(name, MediaGcTest.GIF, "image/gif"))
+
+    def test_identical_uploads_share_a_file(self):
+        print("Test 20-1. Identical uploads are stored once and counted")
+        first, second = self.upload("one.GIF"), self.upload("two.gif")
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name,
+                         r"^posts/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.gif$")
+        path = first.image.path
+        self.assertEqual(len(os.listdir(os.path.dirname(path))), 1)
+
+        self.client.force_login(self.user)
+        self.client.post(reverse("post_edit", args=["uploader", first.pk]),
+                         {"text": "edited"})
+        # two posts and the revision of the edit
+        self.assertEqual(StoredFile.objects.get().refcount, 3)
+
+        second.delete()
+        self.assertTrue(os.path.exists(path))
+        first.delete()
+        self.assertFalse(StoredFile.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_reused_file_is_kept(self):
+        print("Test 20-2. A file released and uploaded again is kept")
+        post = self.upload("one.gif")
+        path = post.image.path
+        os.utime(path, (0, 0))
+        with transaction.atomic():
+            post.delete()
+            again = self.upload("two.gif")
+        self.assertEqual(again.image.path, path)
+        self.assertTrue(os.path.exists(path))
+        self.assertGreater(os.path.getmtime(path), 0)
+        self.assertEqual(StoredFile.objects.get().refcount, 1)
+
+
+class MediaServeTest(TestCase):
+    NAME = "posts/ab/cd/" + "abcd" * 16 + ".gif"
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        self.settings = override_settings(MEDIA_ROOT=root)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        os.makedirs(os.path.join(root, "posts", "ab", "cd"))
+        with open(os.path.join(root, self.NAME), "wb") as f:
+            f.write(b"0123456789")
+        with open(os.path.join(root, "legacy.txt"), "wb") as f:
+            f.write(b"text")
+        self.url = reverse("media", args=[self.NAME])
+
+    def body(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_conditional_and_ranges(self):
+        print("Test 21-1. Media is served with ETag and byte ranges")
+        response = self.client.get(self.url)
+        self.assertEqual(self.body(response), b"0123456789")
+        self.assertEqual(response["Content-Type"], "image/gif")
+        self.assertIn("immutable", response["Cache-Control"])
+        legacy = self.client.get(reverse("media", args=["legacy.txt"]))
+        self.assertNotIn("immutable", legacy["Cache-Control"])
+
+        etag = response["ETag"]
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=2-5")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 2-5/10")
+        self.assertEqual(self.body(response), b"2345")
+        response = self.client.get(self.url, HTTP_RANGE="bytes=-3")
+        self.assertEqual(self.body(response), b"789")
+        response = self.client.get(self.url, HTTP_RANGE="bytes=2-5",
+                                   HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.url, HTTP_RANGE="bytes=20-")
+        self.assertEqual(response.status_code, 416)
+        self.assertFalse(response.has_header("Cache-Control"))
+        self.assertFalse(response.has_header("ETag"))
+
+        response = self.client.get(
+            reverse("media", args=["posts/../../etc/passwd"]))
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(MEDIA_ACCEL="nginx")
+    def test_accel_redirect(self):
+        print("Test 21-2. The body can be left to the front proxy")
+        response = self.client.get(self.url)
+        self.assertEqual(response["X-Accel-Redirect"],
+                         "/protected-media/" + self.NAME)
+        self.assertEqual(response.content, b"")
+
+
+class FollowBulkTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="migrant",
+                                             password="12345")
+        self.authors = [User.objects.create_user(username=f"author{i}")
+                        for i in range(30)]
+        self.client.force_login(self.user)
+
+    def test_follow_many_queries(self):
+        print("Test 22-1. Many authors are followed in a few queries")
+        Follow.objects.create(user=self.user, author=self.authors[0])
+        names = [author.username for author in self.authors]
+        with self.assertNumQueries(3):
+            result = follow_many(self.user, names + ["ghost", "migrant"])
+        self.assertEqual(result, {"followed": 29, "already": 1,
+                                  "missing": ["ghost"]})
+        self.assertEqual(Follow.objects.filter(user=self.user).count(), 30)
+
+    def test_import_and_unfollow(self):
+        print("Test 22-2. Authors are imported from a file and unfollowed")
+        upload = SimpleUploadedFile(
+            "follows.csv", b"username\nauthor1\n@author2\n", "text/csv")
+        response = self.client.post(reverse("follow_bulk"),
+                                    {"usernames": "author3, author4",
+                                     "file": upload,
+                                     "action": "follow"})
+        self.assertEqual(response.context["result"]["followed"], 4)
+
+        response = self.client.post(
+            reverse("follow_bulk"),
+            json.dumps({"unfollow": ["author1", "author3"]}),
+            content_type="application/json")
+        self.assertEqual(response.json(), {"unfollowed": 2})
+        self.assertEqual(
+            set(Follow.objects.values_list("author__username", flat=True)),
+            {"author2", "author4"})
+
+    @override_settings(FOLLOW_IMPORT_MAX_SIZE=1024)
+    def test_large_file_is_refused(self):
+        print("Test 22-3. Files over the size limit are not read")
+        upload = SimpleUploadedFile("follows.csv", b"author1\n" * 200,
+                                    "text/csv")
+        response = self.client.post(reverse("follow_bulk"),
+                                    {"file": upload, "action": "follow"})
+        self.assertFormError(response, "form", None, "Файл больше 1 КБ")
+        self.assertFalse(Follow.objects.exists())
+
+
+class AccountDeletionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="leaving",
+                                             password="12345")
+        self.other = User.objects.create_user(username="staying")
+        self.post = Post.objects.create(text="Прощальная запись",
+                                        author=self.user)
+        self.other_post = Post.objects.create(text="Остаюсь",
+                                              author=self.other)
+        Comment.objects.create(post=self.other_post, author=self.user,
+                               text="Пока")
+        Follow.objects.create(user=self.user, author=self.other)
+        like(self.user, self.other_post.pk)
+        like(self.other, self.post.pk)
+        self.client.force_login(self.user)
+
+    def test_hidden_then_deleted(self):
+        print("Test 23-1. A deleted account is hidden at once, "
+              "its content goes in batches")
+        response = self.client.post(reverse("account_delete"))
+        self.assertRedirects(response, reverse("index"))
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+
+        client = Client()
+        response = client.get(reverse("profile", args=["leaving"]))
+        self.assertEqual(response.status_code, 404)
+        response = client.get(reverse("post", args=["leaving", self.post.pk]))
+        self.assertEqual(response.status_code, 404)
+        response = client.get(reverse("index"))
+        self.assertNotContains(response, "Прощальная запись")
+        response = client.get(
+            reverse("post", args=["staying", self.other_post.pk]))
+        self.assertNotContains(response, "Пока")
+
+        call_command("delete_accounts", batch_size=1, stdout=StringIO())
+        self.assertFalse(User.objects.filter(username="leaving").exists())
+        self.assertFalse(Post.objects.filter(pk=self.post.pk).exists())
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(Follow.objects.exists())
+        total = sum(LikeCounter.objects.filter(post=self.other_post)
+                    .values_list("count", flat=True))
+        self.assertEqual(total, 0)
+        deletion = AccountDeletion.objects.get()
+        self.assertEqual(deletion.stage, "done")
+        self.assertIsNotNone(deletion.finished)
+
+    def test_group_stats(self):
+        print("Test 23-2. Deleting archived posts updates group stats")
+        group = Group.objects.create(title="Группа", slug="group")
+        old = Post.objects.create(text="Старая запись", author=self.user,
+                                  group=group)
+        archive_batch([old.pk])
+        Post.objects.create(text="Новая запись", author=self.user,
+                            group=group)
+        Post.objects.create(text="Чужая запись", author=self.other,
+                            group=group)
+        self.assertEqual(GroupStats.objects.get(group=group).posts_count, 3)
+
+        self.client.post(reverse("account_delete"))
+        call_command("delete_accounts", stdout=StringIO())
+        self.assertFalse(ArchivedPost.objects.exists())
+        self.assertEqual(GroupStats.objects.get(group=group).posts_count, 1)
+
+
+class CommentFragmentTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="writer")
+        self.reader = User.objects.create_user(username="reader",
+                                               password="12345")
+        self.post = Post.objects.create(text="Пост", author=self.author)
+        self.client.force_login(self.reader)
+        self.url = reverse("add_comment", args=["writer", self.post.pk])
+
+    def test_comment_fragment(self):
+        print("Test 24-1. An ajax comment returns only the new comment")
+        self.client.post(self.url, {"text": "warm up"},
+                         HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+        with self.assertNumQueries(1):
+            response = self.client.post(
+                self.url, {"text": "Отличный пост"},
+                HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+        self.assertEqual(response.status_code, 201)
+        self.assertContains(response, "Отличный пост", status_code=201)
+        self.assertNotContains(response, "<html", status_code=201)
+
+        response = self.client.post(self.url + "?fragment=1", {"text": ""})
+        self.assertEqual(response.status_code, 400)
+        self.assertContains(response, "invalid-feedback", status_code=400)
+
+    @override_settings(COMMENTS_PAGE_SIZE=2)
+    def test_comment_pages(self):
+        print("Test 24-2. Comments are paginated, pages come as fragments")
+        comments = [Comment.objects.create(post=self.post,
+                                           author=self.reader,
+                                           text=f"comment {i}")
+                    for i in range(3)]
+        url = reverse("post", args=["writer", self.post.pk])
+        response = self.client.get(url)
+        self.assertContains(response, "comment 1")
+        self.assertNotContains(response, "comment 2")
+        self.assertContains(response, f"?after={comments[1].pk}")
+        self.assertNotIn("items", response.context)
+
+        # added while the page is open, the next page continues after
+        # the last comment shown instead of shifting by one
+        Comment.objects.create(post=self.post, author=self.reader,
+                               text="comment 3")
+        response = self.client.get(url, {"after": comments[1].pk,
+                                         "fragment": 1})
+        self.assertContains(response, "comment 2")
+        self.assertContains(response, "comment 3")
+        self.assertNotContains(response, "comment 1")
+        self.assertNotContains(response, "?after=")
+        self.assertNotContains(response, "<html")
+
+
+@override_settings(PASSWORD_PBKDF2_ITERATIONS=1000)
+class PasswordHashingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="walker",
+                                             password="Secret-123")
+        self.credentials = {"username": "walker", "password": "Secret-123"}
+
+    @override_settings(PASSWORD_PBKDF2_ITERATIONS=2000)
+    def test_rehash_on_login(self):
+        print("Test 25-1. Login rehashes with new iterations and is timed")
+        response = self.client.post(reverse("login"), self.credentials)
+        self.assertEqual(response.status_code, 302)
+        self.assertIn("hash;dur=", response["Server-Timing"])
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("pbkdf2_sha256$2000$"))
+
+    @override_settings(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_WAIT=0.01)
+    def test_busy_hashing(self):
+        print("Test 25-2. Logins beyond the hashing slots get 503")
+        semaphore = hashers.slots()
+        semaphore.acquire()
+        self.addCleanup(semaphore.release)
+        response = self.client.post(reverse("login"), self.credentials)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+
+    def test_benchmark_uses_configured_hasher(self):
+        print("Test 25-3. bench_hashers measures the budgeted hasher")
+        out = StringIO()
+        call_command("bench_hashers", "--seconds", "0.05", stdout=out)
+        self.assertIn("yatube.hashers.PBKDF2PasswordHasher", out.getvalue())
+        self.assertIn("busy/s", out.getvalue())
+
+
+@override_settings(DEFERRED_WORKERS=0)
+class LoadTestCommandTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="author")
+        Post.objects.create(text="existing", author=self.author)
+
+    def test_cleans_up(self):
+        print("Test 26-1. loadtest removes its users and their data")
+        out = StringIO()
+        call_command("loadtest", stages="1", duration=0.5, users=2,
+                     no_ratelimit=True, seed=1, stdout=out)
+        self.assertIn("Removed 2 load test users", out.getvalue())
+        self.assertEqual(list(User.objects.values_list("username",
+                                                       flat=True)),
+                         ["author"])
+        self.assertEqual(list(Post.objects.values_list("text", flat=True)),
+                         ["existing"])
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(Session.objects.exists())
@@ -1,22 +1,53 @@
 from django.urls import path
 
-from . import views
+from . import feeds, views
 
 urlpatterns = [
     # Главная страница
     path('', views.index, name='index'),
     path('new', views.new_post, name='new_post'),
+    path('groups/', views.group_list, name='group_list'),
     path('group/<slug:slug>/', views.group_posts, name='group'),
+    path('feed/rss/',
+         feeds.cached_feed(feeds.LatestPostsFeed()),
+         name='feed_rss'),
+    path('feed/atom/',
+         feeds.cached_feed(feeds.LatestPostsAtomFeed()),
+         name='feed_atom'),
+    path('group/<slug:slug>/rss/',
+         feeds.cached_feed(feeds.GroupPostsFeed()),
+         name='group_feed_rss'),
+    path('group/<slug:slug>/atom/',
+         feeds.cached_feed(feeds.GroupPostsAtomFeed()),
+         name='group_feed_atom'),
     path("<str:username>/follow/", views.profile_follow, name="profile_follow"),
     path("<str:username>/unfollow/", views.profile_unfollow, name="profile_unfollow"),
     path("follow/", views.follow_index, name="follow_index"),
+    path("follow/bulk/", views.follow_bulk, name="follow_bulk"),
+    path("tag/<str:name>/", views.tag_posts, name="tag"),
+    path("mentions/", views.mentions, name="mentions"),
+    path("notifications/", views.notifications, name="notifications"),
+    path("account/delete/", views.account_delete, name="account_delete"),
     path('<str:username>/', views.profile, name='profile'),
+    path('<str:username>/rss/',
+         feeds.cached_feed(feeds.AuthorPostsFeed()),
+         name='profile_feed_rss'),
+    path('<str:username>/atom/',
+         feeds.cached_feed(feeds.AuthorPostsAtomFeed()),
+         name='profile_feed_atom'),
     path('<str:username>/<int:post_id>/', views.post_view, name='post'),
     path(
         '<str:username>/<int:post_id>/edit/',
         views.post_edit,
         name='post_edit'
         ),
+    path(
+        '<str:username>/<int:post_id>/history/',
+        views.post_history,
+        name='post_history'
+        ),
+    path("<str:username>/<int:post_id>/like/", views.post_like, name="post_like"),
+    path("<str:username>/<int:post_id>/unlike/", views.post_unlike, name="post_unlike"),
     path("<str:username>/<int:post_id>/comment/", views.add_comment, name="add_comment"),
 
 ]
@@ -0,0 +1,28 @@
+from itertools import islice
+
+
+def chunked(iterable, size):
+    """Split any iterable (e.g. queryset.iterator()) into lists of `size`"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def pk_batches(queryset, size):
+    """
+    Primary keys of the queryset in batches, paginated by pk > last
+    instead of OFFSET. Safe to update or delete the rows of each batch
+    before asking for the next one.
+    """
+    pks = queryset.order_by("pk").values_list("pk", flat=True)
+    last = None
+    while True:
+        batch = list((pks if last is None else pks.filter(pk__gt=last))
+                     [:size])
+        if not batch:
+            return
+        yield batch
+        last = batch[-1]
@@ -1,31 +1,57 @@
+import json
+
+from django.conf import settings
+from django.contrib.auth import logout
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import F
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils.http import is_safe_url
+from django.views.decorators.http import require_POST
+
+from yatube.ratelimit import ratelimit
 
-from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
+from .accounts import request_deletion
+from .archive import ArchiveChain
+from .follows import FollowImportError, follow_many, unfollow_many
+from .forms import CommentForm, FollowImportForm, PostForm
+from .likes import like, like_version, unlike, with_likes
+from .models import ArchivedPost, Follow, Group, Notification, Post, Tag
+from .object_cache import (get_group_or_404, get_post, get_post_or_404,
+                           get_posts, get_user_or_404)
+from .notifications import (notify_followers, notify_post_author,
+                            reset_unread)
+from .revisions import record_revision, text_at
+from .spam import check_comment, check_post
+from .tasks import defer
 
 
 def index(request):
-    post_list = Post.objects.select_related("author", "group").all()
+    post_list = (Post.objects.select_related("author", "group")
+                 .filter(author__is_active=True))
     paginator = Paginator(post_list, 10)
     page_number = request.GET.get("page")
     page = paginator.get_page(page_number)
+    page.object_list = with_likes(list(page.object_list), request.user)
     return render(request,
                   "index.html",
                   {"page": page,
                    "paginator": paginator,
-                   "post": post_list},
+                   "post": post_list,
+                   "like_version": like_version(request.user)},
                   )
 
 
 def group_posts(request, slug):
     """Returns posts that belong to a specific community"""
-    group = get_object_or_404(Group, slug=slug)
-    posts_group = group.posts.all()
+    group = get_group_or_404(slug)
+    posts_group = group.posts.filter(author__is_active=True)
     paginator = Paginator(posts_group, 5)
     page_number = request.GET.get("page")
     page = paginator.get_page(page_number)
+    page.object_list = with_likes(list(page.object_list), request.user)
     return render(request,
                   "group.html",
                   {"page": page,
@@ -35,7 +61,82 @@ def group_posts(request, slug):
                   )
 
 
+def posts_in_order(post_ids):
+    """
+    Posts of a page of ids taken from an index table, in its order.
+    Hot posts come from the object cache, ids it doesn't know are looked
+    up in the archive.
+    """
+    posts = get_posts(post_ids)
+    missing = [pk for pk in post_ids if pk not in posts]
+    if missing:
+        posts.update(ArchivedPost.objects.select_related("author", "group")
+                     .filter(author__is_active=True)
+                     .in_bulk(missing))
+    return [posts[pk] for pk in post_ids if pk in posts]
+
+
+def tag_posts(request, name):
+    """Posts with the #tag, newest first"""
+    tag = get_object_or_404(Tag, name=name.lower())
+    post_ids = ArchiveChain(
+        tag.post_tags.order_by("-pub_date", "-post")
+        .values_list("post_id", flat=True),
+        tag.archived_post_tags.order_by("-pub_date", "-post")
+        .values_list("post_id", flat=True))
+    paginator = Paginator(post_ids, 10)
+    page = paginator.get_page(request.GET.get("page"))
+    page.object_list = with_likes(posts_in_order(list(page.object_list)),
+                                  request.user)
+    return render(request,
+                  "tag.html",
+                  {"page": page,
+                   "tag": tag,
+                   "paginator": paginator})
+
+
 @login_required
+def mentions(request):
+    """Posts mentioning the current user, newest first"""
+    post_ids = ArchiveChain(
+        request.user.mentions.order_by("-pub_date", "-post")
+        .values_list("post_id", flat=True),
+        request.user.archived_mentions.order_by("-pub_date", "-post")
+        .values_list("post_id", flat=True))
+    paginator = Paginator(post_ids, 10)
+    page = paginator.get_page(request.GET.get("page"))
+    page.object_list = with_likes(posts_in_order(list(page.object_list)),
+                                  request.user)
+    return render(request,
+                  "mentions.html",
+                  {"page": page,
+                   "paginator": paginator})
+
+
+GROUP_ORDERINGS = {
+    "activity": F("stats__last_post").desc(nulls_last=True),
+    "posts": F("stats__posts_count").desc(nulls_last=True),
+    "authors": F("stats__recent_authors").desc(nulls_last=True),
+    "title": F("title").asc(),
+}
+
+
+def group_list(request):
+    """Directory of communities with their activity"""
+    sort = request.GET.get("sort")
+    if sort not in GROUP_ORDERINGS:
+        sort = "activity"
+    groups = (Group.objects.select_related("stats")
+              .order_by(GROUP_ORDERINGS[sort], "pk"))
+    return render(request,
+                  "groups.html",
+                  {"groups": groups,
+                   "sort": sort,
+                   "recent_days": settings.GROUP_STATS_RECENT_DAYS})
+
+
+@login_required
+@ratelimit("new_post", methods=("POST",))
 def new_post(request):
     """Create new posts"""
     form = PostForm(request.POST or None, files=request.FILES or None)
@@ -44,6 +145,8 @@ def new_post(request):
             new_article = form.save(commit=False)
             new_article.author = request.user
             new_article.save()
+            defer(notify_followers, new_article.pk)
+            defer(check_post, new_article.pk)
             return redirect("index")
 
     return render(request,
@@ -53,13 +156,15 @@ def new_post(request):
 
 
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts_count = author.posts.count()
-    author_posts = author.posts.all()
+    author = get_user_or_404(username)
+    author_posts = ArchiveChain(author.posts.all(),
+                                author.archived_posts.all())
     following_count = author.following.count()
     follower_count = author.follower.count()
     paginator = Paginator(author_posts, 3)
     page = paginator.get_page(request.GET.get("page"))
+    page.object_list = with_likes(list(page.object_list), request.user)
+    posts_count = paginator.count
     following = author.following.all()
     return render(request, "profile.html", {
         "page": page,
@@ -72,13 +177,51 @@ def profile(request, username):
     })
 
 
+def wants_fragment(request):
+    """Ajax calls and ?fragment=1 get only the changed part of a page"""
+    return request.is_ajax() or request.GET.get("fragment") == "1"
+
+
+def find_post(username, post_id):
+    post = get_post(post_id, username)
+    if post is None:
+        post = get_object_or_404(
+            ArchivedPost.objects.select_related("author", "group"),
+            author__username=username, author__is_active=True, id=post_id)
+    return post
+
+
+def post_comments(post, after=None):
+    """
+    A page of comments after the comment with the given id and the id
+    to load the next page after, None on the last page. Unlike page
+    numbers, this doesn't repeat comments added in between.
+    """
+    after = int(after) if after and after.isdigit() else 0
+    comments = list(post.comments.filter(author__is_active=True,
+                                         pk__gt=after)
+                    .select_related("author").order_by("pk")
+                    [:settings.COMMENTS_PAGE_SIZE + 1])
+    if len(comments) <= settings.COMMENTS_PAGE_SIZE:
+        return comments, None
+    comments = comments[:-1]
+    return comments, comments[-1].pk
+
+
 def post_view(request, username, post_id):
-    post = get_object_or_404(Post, author__username=username, id=post_id)
+    post = find_post(username, post_id)
+    comments, more_after = post_comments(post, request.GET.get("after"))
+    if wants_fragment(request):
+        return render(request,
+                      "includes/comment_list.html",
+                      {"post": post,
+                       "comments": comments,
+                       "more_after": more_after})
+    with_likes([post], request.user)
     author = post.author
-    posts_count = author.posts.count()
+    posts_count = author.posts.count() + author.archived_posts.count()
     following_count = author.following.count()
     follower_count = author.follower.count()
-    items = post.comments.all()
     form = CommentForm()
     following = author.following.all()
     return render(request,
@@ -86,7 +229,8 @@ def post_view(request, username, post_id):
                   {"post": post,
                    "author": author,
                    "posts_count": posts_count,
-                   "items": items,
+                   "comments": comments,
+                   "more_after": more_after,
                    "form": form,
                    "following_count": following_count,
                    "follower_count": follower_count,
@@ -96,21 +240,47 @@ def post_view(request, username, post_id):
 
 @login_required
 def post_edit(request, username, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    post = get_post_or_404(post_id)
     if post.author != request.user:
         return post_view(request, username, post_id)
+    old_text, old_image = post.text, post.image.name
     form = PostForm(request.POST or None,
                     files=request.FILES or None,
                     instance=post)
     form_content = {"form": form, "post": post, "post_edit": True}
     if form.is_valid():
-        post.save()
+        with transaction.atomic():
+            if post.text != old_text or post.image.name != old_image:
+                record_revision(post)
+            post.save()
+        if post.text != old_text:
+            defer(check_post, post.pk)
         return redirect("post", username=username, post_id=post_id)
     return render(request,
                   "new.html",
                   form_content)
 
 
+@login_required
+def post_history(request, username, post_id):
+    """Previous versions of the post, for its author and moderators"""
+    post = find_post(username, post_id)
+    if post.author != request.user and not request.user.is_staff:
+        return redirect("post", username=username, post_id=post_id)
+    revisions = post.revisions.defer("body")
+    selected = request.GET.get("rev")
+    text = None
+    if selected and selected.isdigit() and 0 < int(selected) <= post.revision:
+        selected = int(selected)
+        text = text_at(post, selected)
+    return render(request,
+                  "post_history.html",
+                  {"post": post,
+                   "revisions": revisions,
+                   "selected": selected,
+                   "text": text})
+
+
 def page_not_found(request, exception=None):
     return render(
         request,
@@ -125,31 +295,48 @@ def server_error(request):
 
 
 @login_required
+@ratelimit("add_comment", methods=("POST",))
 def add_comment(request, username, post_id):
-    post = get_object_or_404(Post, author__username=username, id=post_id)
+    """
+    In fragment mode the answer is only the new comment, or the form
+    with its errors, for the page to insert in place
+    """
+    post = get_post_or_404(post_id, username)
     form = CommentForm(request.POST or None)
-    items = post.comments.all()
     if form.is_valid():
         comment = form.save(commit=False)
         comment.post = post
         comment.author = request.user
         comment.save()
+        defer(notify_post_author, comment.pk)
+        defer(check_comment, comment.pk)
+        if wants_fragment(request):
+            return render(request, "includes/comment.html",
+                          {"item": comment}, status=201)
         return redirect("post", username=username, post_id=post_id)
+    if wants_fragment(request):
+        return render(request, "includes/comment_form.html",
+                      {"post": post, "form": form},
+                      status=400 if form.is_bound else 200)
+    comments, more_after = post_comments(post)
     context = {
         "post_author": post.author,
         "post": post,
         "form": CommentForm(),
-        "items": items,
+        "comments": comments,
+        "more_after": more_after,
     }
     return render(request, "comments.html", context)
 
 
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
+    post_list = Post.objects.filter(author__following__user=request.user,
+                                    author__is_active=True)
     paginator = Paginator(post_list, 10)
     page_number = request.GET.get("page")
     page = paginator.get_page(page_number)
+    page.object_list = with_likes(list(page.object_list), request.user)
     return render(request,
                   "follow.html",
                   {"page": page,
@@ -157,8 +344,9 @@ def follow_index(request):
 
 
 @login_required
+@ratelimit("follow")
 def profile_follow(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_user_or_404(username)
     if author == request.user:
         return redirect("profile", username)
     Follow.objects.get_or_create(user=request.user, author=author)
@@ -166,7 +354,104 @@ def profile_follow(request, username):
 
 
 @login_required
+@ratelimit("follow_bulk", methods=("POST",))
+def follow_bulk(request):
+    """
+    Follow or unfollow many authors: a form with a list or a CSV/JSON
+    file, or a JSON body {"follow": [...], "unfollow": [...]}
+    """
+    if request.method == "POST" and request.content_type == "application/json":
+        return follow_bulk_json(request)
+    form = FollowImportForm(request.POST or None, files=request.FILES or None)
+    result = None
+    if form.is_valid():
+        action = (follow_many if form.cleaned_data["action"] == form.FOLLOW
+                  else unfollow_many)
+        try:
+            result = action(request.user, form.cleaned_data["names"])
+        except FollowImportError as e:
+            form.add_error(None, str(e))
+    return render(request,
+                  "follow_import.html",
+                  {"form": form,
+                   "result": result})
+
+
+def follow_bulk_json(request):
+    try:
+        data = json.loads(request.body)
+        follow = [str(name) for name in data.get("follow", [])]
+        unfollow = [str(name) for name in data.get("unfollow", [])]
+        result = {}
+        if follow:
+            result.update(follow_many(request.user, follow))
+        if unfollow:
+            result.update(unfollow_many(request.user, unfollow))
+    except (ValueError, AttributeError, TypeError) as e:
+        return JsonResponse({"error": str(e) or "Некорректный JSON"},
+                            status=400)
+    return JsonResponse(result)
+
+
+@login_required
+@ratelimit("follow")
 def profile_unfollow(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_user_or_404(username)
     Follow.objects.filter(user=request.user, author=author).delete()
     return redirect("profile", username)
+
+
+@login_required
+def account_delete(request):
+    """Confirmation page, the content is removed by delete_accounts"""
+    if request.method == "POST":
+        request_deletion(request.user)
+        logout(request)
+        return redirect("index")
+    return render(request, "account_delete.html")
+
+
+@login_required
+def notifications(request):
+    """Inbox of the current user, the page shown is marked as read"""
+    notification_list = (request.user.notifications
+                         .select_related("actor", "post__author"))
+    paginator = Paginator(notification_list, 20)
+    page = paginator.get_page(request.GET.get("page"))
+    response = render(request,
+                      "notifications.html",
+                      {"page": page,
+                       "paginator": paginator})
+    unread = [n.pk for n in page.object_list if not n.is_read]
+    if unread and (Notification.objects.filter(pk__in=unread, is_read=False)
+                   .update(is_read=True)):
+        reset_unread([request.user.pk])
+    return response
+
+
+@login_required
+@require_POST
+@ratelimit("like")
+def post_like(request, username, post_id):
+    post = get_post_or_404(post_id, username)
+    like(request.user, post.pk)
+    return redirect_back(request, post)
+
+
+@login_required
+@require_POST
+@ratelimit("like")
+def post_unlike(request, username, post_id):
+    post = get_post_or_404(post_id, username)
+    unlike(request.user, post.pk)
+    return redirect_back(request, post)
+
+
+def redirect_back(request, post):
+    """Return to the page the like button was pressed on"""
+    next_url = request.META.get("HTTP_REFERER")
+    if next_url and is_safe_url(next_url,
+                                allowed_hosts={request.get_host()},
+                                require_https=request.is_secure()):
+        return redirect(next_url)
+    return redirect(post)
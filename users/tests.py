@@ -1,3 +1,44 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from .middleware import user_cache_key
+
+User = get_user_model()
+
+
+class CachedAuthTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username="leela", password="12345", email="leela@planet.com"
+        )
+        self.client.force_login(self.user)
+
+    def test_user_served_from_cache(self):
+        self.client.get(reverse("new_post"))
+        self.assertIsNotNone(cache.get(user_cache_key(self.user.pk)))
+        # only the group choices of the form hit the database
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("new_post"))
+        self.assertEqual(response.status_code, 200)
+
+    def test_password_change_drops_session(self):
+        self.client.get(reverse("new_post"))
+        self.user.set_password("54321")
+        self.user.save()
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+        response = self.client.get(reverse("new_post"))
+        self.assertEqual(response.status_code, 302)
+
+    def test_logout_drops_cached_user(self):
+        self.client.get(reverse("new_post"))
+        self.client.get(reverse("logout"))
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+
+    def test_anonymous_does_not_touch_sessions(self):
+        with self.assertNumQueries(0):
+            self.client_class().get(reverse("signup"))
@@ -7,3 +7,19 @@ def year(request):
     """
     current_year = dt.datetime.today().year
     return {'year': current_year}
+
+
+def notifications(request):
+    """
+    Add counter of unread notifications.
+    Evaluated only when a template uses it.
+    """
+    from posts.notifications import unread_count
+
+    user = getattr(request, "user", None)
+    if user is None:
+        return {}
+
+    def count():
+        return unread_count(user) if user.is_authenticated else 0
+    return {"unread_notifications": count}
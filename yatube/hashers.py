@@ -0,0 +1,102 @@
+"""
+Password hashing with a tunable cost and a CPU budget.
+
+PBKDF2PasswordHasher takes its iterations from
+PASSWORD_PBKDF2_ITERATIONS. Django rehashes a password on a successful
+login when the stored hash was made with other parameters, so changing
+the setting moves users over as they log in.
+
+At most PASSWORD_HASH_WORKERS hashes run at the same time (hashlib
+releases the GIL, so this is how many cores hashing may take). A
+request that can't get a slot within PASSWORD_HASH_WAIT seconds gets a
+503 from HashingMiddleware instead of piling up behind a login storm,
+and feed requests keep the remaining workers. The time spent hashing
+is reported in the Server-Timing header and as a "hash" tracing span.
+
+Run the bench_hashers command to pick the iterations.
+"""
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.shortcuts import render
+
+from .tracing import span
+
+_local = threading.local()
+_slots = None
+_slots_lock = threading.Lock()
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def slots():
+    global _slots
+    with _slots_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(
+                settings.PASSWORD_HASH_WORKERS)
+        return _slots
+
+
+@receiver(setting_changed)
+def reset_slots(setting, **kwargs):
+    global _slots
+    if setting == "PASSWORD_HASH_WORKERS":
+        _slots = None
+
+
+def budgeted(method):
+    """Run a hasher method in a worker slot and account its time"""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        semaphore = slots()
+        if not semaphore.acquire(timeout=settings.PASSWORD_HASH_WAIT):
+            raise HashingBusy()
+        start = time.perf_counter()
+        try:
+            with span("hash", self.algorithm):
+                return method(self, *args, **kwargs)
+        finally:
+            semaphore.release()
+            _local.spent = (getattr(_local, "spent", 0)
+                            + time.perf_counter() - start)
+    return wrapper
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_PBKDF2_ITERATIONS
+
+    # verify() and harden_runtime() hash through encode()
+    encode = budgeted(hashers.PBKDF2PasswordHasher.encode)
+
+
+class HashingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _local.spent = 0
+        response = self.get_response(request)
+        if _local.spent:
+            timing = f"hash;dur={_local.spent * 1000:.1f}"
+            if response.has_header("Server-Timing"):
+                timing = f"{response['Server-Timing']}, {timing}"
+            response["Server-Timing"] = timing
+        return response
+
+    def process_exception(self, request, exception):
+        if not isinstance(exception, HashingBusy):
+            return None
+        response = render(request, "misc/503.html", status=503)
+        response["Retry-After"] = "1"
+        return response
@@ -0,0 +1,142 @@
+"""
+Serving of uploaded media in production.
+
+serve() answers conditional requests (strong ETag from size and mtime,
+Last-Modified) and single byte ranges itself. Content-addressed images
+and sorl thumbnails never change under their name, so they are sent
+with an immutable Cache-Control; other files get MEDIA_MAX_AGE.
+
+With MEDIA_ACCEL set, the body is left to the front proxy:
+"nginx" answers with X-Accel-Redirect to MEDIA_ACCEL_PREFIX + path (an
+internal location aliased to MEDIA_ROOT), "sendfile" with X-Sendfile
+and the absolute path (Apache, lighttpd). Python then never reads the
+file, the proxy also handles Range.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (Http404, HttpResponse, HttpResponseNotAllowed,
+                         StreamingHttpResponse)
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from sorl.thumbnail.conf import settings as thumbnail_settings
+
+from posts.storage import content_storage
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+IMMUTABLE = "public, max-age=31536000, immutable"
+CACHEABLE = (200, 206, 304)
+
+
+def is_immutable(path):
+    return (content_storage.is_content_addressed(path)
+            or path.startswith(thumbnail_settings.THUMBNAIL_PREFIX))
+
+
+def etag_for(stat):
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def byte_range(request, size, etag, last_modified):
+    """(start, end) of a satisfiable single range, None for the full
+    file, False if the range can't be satisfied"""
+    header = request.META.get("HTTP_RANGE")
+    if not header:
+        return None
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if if_range and if_range != etag and (
+            parse_http_date_safe(if_range) != last_modified):
+        return None
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        # multiple ranges and other units: send the whole file
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def read_range(path, start, length):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
+
+
+def serve(request, path):
+    if request.method not in ("GET", "HEAD"):
+        return HttpResponseNotAllowed(["GET", "HEAD"])
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    etag = etag_for(stat)
+    last_modified = int(stat.st_mtime)
+    response = get_conditional_response(request, etag=etag,
+                                        last_modified=last_modified)
+    if response is None:
+        response = file_response(request, path, full_path, stat.st_size,
+                                 etag, last_modified)
+    if response.status_code not in CACHEABLE:
+        # a 412 or 416 must not be kept by shared caches
+        return response
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    response["Cache-Control"] = (
+        IMMUTABLE if is_immutable(path)
+        else f"public, max-age={settings.MEDIA_MAX_AGE}")
+    return response
+
+
+def file_response(request, path, full_path, size, etag, last_modified):
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or "application/octet-stream"
+
+    if settings.MEDIA_ACCEL == "nginx":
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = (settings.MEDIA_ACCEL_PREFIX
+                                        + quote(path))
+    elif settings.MEDIA_ACCEL == "sendfile":
+        response = HttpResponse(content_type=content_type)
+        response["X-Sendfile"] = full_path
+    else:
+        span = byte_range(request, size, etag, last_modified)
+        if span is False:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+        start, end = span or (0, size - 1)
+        length = end - start + 1 if size else 0
+        body = (read_range(full_path, start, length)
+                if request.method == "GET" else [])
+        response = StreamingHttpResponse(body, content_type=content_type)
+        response["Content-Length"] = str(length)
+        if span:
+            response.status_code = 206
+            response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response["Accept-Ranges"] = "bytes"
+    if encoding:
+        response["Content-Encoding"] = encoding
+    return response
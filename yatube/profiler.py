@@ -0,0 +1,148 @@
+"""
+Sampling profiler for single requests.
+
+A request is profiled when it carries a valid signed X-Profile header
+(see make_token), when a staff user adds ?profile=1, or at random for
+settings.PROFILER_SAMPLE_RATE of the traffic. While the view and its
+templates run, a background thread samples the stack of the request
+thread every PROFILER_INTERVAL seconds.
+
+Samples are written in the collapsed format read by flamegraph.pl and
+speedscope, one file per request under PROFILER_ROOT/<view name>/,
+keeping the last PROFILER_KEEP files of each view. Only explicitly
+requested profiles name their file in the X-Profile response header,
+randomly sampled ones are just written.
+"""
+import faulthandler
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core import signing
+
+SALT = "yatube.profiler"
+
+
+def make_token():
+    """Value for the X-Profile header, valid for PROFILER_TOKEN_MAX_AGE."""
+    return signing.TimestampSigner(salt=SALT).sign("profile")
+
+
+def valid_token(token):
+    try:
+        signing.TimestampSigner(salt=SALT).unsign(
+            token, max_age=settings.PROFILER_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+THREAD_RE = re.compile(r"^(?:Current thread|Thread) (0x[0-9a-f]+)")
+FRAME_RE = re.compile(r'^  File "(.*)", line (?:\d+|\?\?\?) in (.*)$')
+
+
+class Sampler(threading.Thread):
+    """
+    Stacks come from faulthandler.dump_traceback, which walks the frames
+    in C without letting other threads run. Following f_back of another
+    thread's frame objects from Python is not safe while that thread
+    keeps returning from them and crashed the interpreter. faulthandler
+    stops at 100 frames, deeper stacks lose their outermost callers.
+    """
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def sample(self, fd):
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.ftruncate(fd, 0)
+        faulthandler.dump_traceback(fd, all_threads=True)
+        size = os.lseek(fd, 0, os.SEEK_CUR)
+        lines = os.pread(fd, size, 0).decode(errors="replace").splitlines()
+        stack, current = [], None
+        for line in lines:
+            thread = THREAD_RE.match(line)
+            if thread:
+                current = int(thread.group(1), 16)
+                continue
+            frame = FRAME_RE.match(line)
+            if frame and current == self.thread_id:
+                path, name = frame.groups()
+                stack.append(f"{os.path.basename(path)}:{name}")
+        if stack:
+            # dumped most recent call first
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def run(self):
+        with tempfile.TemporaryFile() as buffer:
+            fd = buffer.fileno()
+            self.sample(fd)
+            while not self.stopped.wait(self.interval):
+                self.sample(fd)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return self.stacks
+
+
+def save_profile(view_name, stacks):
+    directory = os.path.join(settings.PROFILER_ROOT,
+                             view_name.replace(":", "-"))
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{time.time():.6f}.folded")
+    with open(path, "w") as f:
+        for stack, count in stacks.items():
+            f.write(f"{stack} {count}\n")
+    profiles = sorted(os.listdir(directory))
+    for name in profiles[:-settings.PROFILER_KEEP]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            # rotated by another worker at the same time
+            pass
+    return path
+
+
+class ProfilerMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def requested(self, request):
+        """Explicitly asked for, the client then gets the profile path"""
+        token = request.META.get("HTTP_X_PROFILE")
+        if token:
+            return valid_token(token)
+        if "profile" in request.GET:
+            return request.user.is_staff
+        return False
+
+    def sampled(self):
+        rate = settings.PROFILER_SAMPLE_RATE
+        return rate > 0 and random.random() < rate
+
+    def __call__(self, request):
+        requested = self.requested(request)
+        if not requested and not self.sampled():
+            return self.get_response(request)
+        sampler = Sampler(threading.get_ident(), settings.PROFILER_INTERVAL)
+        sampler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            stacks = sampler.stop()
+        match = request.resolver_match
+        if match is not None and stacks:
+            path = save_profile(match.view_name, stacks)
+            if requested:
+                response["X-Profile"] = os.path.relpath(
+                    path, settings.PROFILER_ROOT)
+        return response
@@ -0,0 +1,139 @@
+"""
+Sliding-window rate limiting for write views.
+
+Counters live in the shared cache, one per (view, user) and one per
+(view, client IP). Limits are configured in settings.RATELIMITS:
+
+    RATELIMITS = {
+        "new_post": {"user": "10/m", "ip": "30/m"},
+    }
+
+A rate "N/P" allows N requests per period P (s, m, h, d, optionally
+with a multiplier: "5/10m"). Each period has its own counter, bumped
+with the atomic cache.incr; the count of the previous period is
+weighted by how much of it still falls into the last P seconds. There
+are no locks: a request that goes over a limit takes its increments
+back, so it is not counted anywhere. An allowed request costs an add
+and an incr per counter and a single get_many.
+"""
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+PERIODS = {"s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60}
+
+
+def parse_rate(rate):
+    """'10/m' -> (10, 60)"""
+    count, period = rate.split("/")
+    multiplier = int(period[:-1] or 1)
+    return int(count), multiplier * PERIODS[period[-1]]
+
+
+def client_ip(request):
+    if settings.RATELIMIT_TRUST_FORWARDED_FOR:
+        forwarded = request.META.get("HTTP_X_FORWARDED_FOR")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def window_keys(key, period, now):
+    window = int(now // period)
+    return f"{key}:{window}", f"{key}:{window - 1}"
+
+
+def increment(key, period):
+    # the counter may expire between add and incr
+    cache.add(key, 0, 2 * period)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, 2 * period)
+        return 1
+
+
+def retry_after(used, previous, capacity, period, elapsed):
+    """Seconds until `used` requests of this window fit the limit"""
+    if used <= capacity and previous:
+        share = 1 - (capacity - used) / previous
+        return max(share * period - elapsed, 0.001)
+    # in the next window this one becomes the previous
+    share = 1 - (capacity - 1) / max(used - 1, 1) if capacity else 1
+    return period - elapsed + max(share, 0) * period
+
+
+def take_tokens(buckets):
+    """
+    Count the request in each of the (key, rate) counters, or in none
+    of them when any is over its limit.
+    Returns 0 when the request is allowed, otherwise the number of
+    seconds until it would be.
+    """
+    now = time.time()
+    limits = [(key, *parse_rate(rate)) for key, rate in buckets]
+    keys = [window_keys(key, period, now) for key, _, period in limits]
+    previous = cache.get_many([prev for _, prev in keys])
+    taken = []
+    wait = 0
+    for (key, capacity, period), (current, prev) in zip(limits, keys):
+        used = increment(current, period)
+        taken.append(current)
+        elapsed = now % period
+        weight = previous.get(prev, 0) * (1 - elapsed / period)
+        if used + weight > capacity:
+            wait = retry_after(used, previous.get(prev, 0), capacity,
+                               period, elapsed)
+            break
+    if wait:
+        for current in taken:
+            try:
+                cache.decr(current)
+            except ValueError:
+                pass
+    return wait
+
+
+def check_rate(request, name):
+    """Returns seconds to wait or 0 if the request is within limits"""
+    limits = settings.RATELIMITS.get(name)
+    if not settings.RATELIMIT_ENABLED or not limits:
+        return 0
+    buckets = []
+    if "user" in limits and request.user.is_authenticated:
+        buckets.append((f"rl:{name}:u:{request.user.pk}", limits["user"]))
+    if "ip" in limits:
+        buckets.append((f"rl:{name}:ip:{client_ip(request)}", limits["ip"]))
+    return take_tokens(buckets)
+
+
+def too_many_requests(request, retry_after):
+    """Plain text, a throttled client gets no page to render"""
+    retry_after = math.ceil(retry_after)
+    response = HttpResponse(
+        f"Слишком много запросов, повторите через {retry_after} с.\n",
+        content_type="text/plain; charset=utf-8",
+        status=429)
+    response["Retry-After"] = str(retry_after)
+    return response
+
+
+def ratelimit(name, methods=None):
+    """
+    View decorator. Only requests with a method from `methods`
+    are counted (all methods if None).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if methods is None or request.method in methods:
+                retry_after = check_rate(request, name)
+                if retry_after:
+                    return too_many_requests(request, retry_after)
+            return view(request, *args, **kwargs)
+        return wrapped
+    return decorator
@@ -39,6 +39,7 @@ INSTALLED_APPS = [
     'posts',  # our app-posts**
     'django.contrib.sites',
     'django.contrib.flatpages',
+    'django.contrib.sitemaps',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -50,11 +51,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'yatube.tracing.TracingMiddleware',
+    'yatube.hashers.HashingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'users.middleware.CachedAuthenticationMiddleware',
+    'yatube.profiler.ProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -73,6 +77,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'yatube.context_processors.year',
+                'yatube.context_processors.notifications',
             ],
         },
     },
@@ -149,4 +154,117 @@ CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
-}
\ No newline at end of file
+}
+
+# Sessions and the logged-in user are served from the cache,
+# the database is used only on a cache miss.
+# In production CACHES must point to a shared backend (memcached/redis).
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+AUTH_USER_CACHE_TIMEOUT = 60 * 15
+
+# Rate limits for write views, see yatube/ratelimit.py
+RATELIMIT_ENABLED = True
+RATELIMIT_TRUST_FORWARDED_FOR = False
+RATELIMITS = {
+    "new_post": {"user": "10/m", "ip": "30/m"},
+    "add_comment": {"user": "30/m", "ip": "60/m"},
+    "follow": {"user": "60/m", "ip": "120/m"},
+    "follow_bulk": {"user": "10/h"},
+    "like": {"user": "60/m", "ip": "120/m"},
+    "signup": {"ip": "5/h"},
+}
+
+# Notifications
+NOTIFICATIONS_BATCH_SIZE = 500
+NOTIFICATIONS_COUNT_TIMEOUT = 60 * 5
+
+# Background threads for deferred work (fan-out etc.), see posts/tasks.py;
+# 0 runs it in the request thread after the response
+DEFERRED_WORKERS = 2
+
+# Email, locally saved to files, see posts/management/commands/send_digest.py
+EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
+EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
+DEFAULT_FROM_EMAIL = "noreply@yatube.ru"
+
+# RSS/Atom feeds
+FEEDS_SIZE = 20
+FEEDS_CACHE_TIMEOUT = 60 * 60
+
+# Sitemaps, see posts/sitemaps.py
+SITEMAP_ROOT = os.path.join(BASE_DIR, "sitemaps")
+SITEMAP_LIMIT = 5000
+SITEMAP_CACHE_TIMEOUT = 60 * 60 * 6
+
+# Admin on big tables, see posts/admin.py
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 10000
+ADMIN_BATCH_SIZE = 1000
+
+# Group directory, authors of the last N days count as recent
+GROUP_STATS_RECENT_DAYS = 30
+
+# Posts older than this are moved to the archive tables by archive_posts
+ARCHIVE_AFTER_DAYS = 365
+
+# Post edit history: full text every N revisions, deltas in between
+POST_REVISION_SNAPSHOT_EVERY = 10
+
+# Likes, see posts/likes.py
+LIKE_COUNTER_SHARDS = 8
+
+# Read-through cache of Post, Group and User, see posts/object_cache.py
+OBJECT_CACHE_VERSION = 1
+OBJECT_CACHE_TIMEOUT = 60 * 60
+
+# Sampling profiler, see yatube/profiler.py
+PROFILER_ROOT = os.path.join(BASE_DIR, "profiles")
+PROFILER_SAMPLE_RATE = 0
+PROFILER_INTERVAL = 0.005
+PROFILER_KEEP = 20
+PROFILER_TOKEN_MAX_AGE = 60 * 60
+
+# Request tracing, see yatube/tracing.py. Only requests slower than
+# TRACING_SLOW_MS or failed ones are written to TRACING_FILE.
+TRACING_ENABLED = False
+TRACING_FILE = os.path.join(BASE_DIR, "traces", "traces.jsonl")
+TRACING_SLOW_MS = 500
+TRACING_MAX_SPANS = 2000
+
+# Near-duplicate (spam) detection, see posts/spam.py. 16 bands of 8 rows
+# make texts with a similarity above ~0.7 likely to share a bucket.
+SPAM_SHINGLE_SIZE = 5
+SPAM_MINHASH_PERMUTATIONS = 128
+SPAM_LSH_BANDS = 16
+SPAM_SIMILARITY = 0.7
+SPAM_MIN_LENGTH = 30
+SPAM_MAX_CANDIDATES = 50
+
+# Directories of MEDIA_ROOT cleaned by the media_gc command
+MEDIA_GC_DIRS = ["posts", "cache"]
+
+# Media served by yatube/media.py. MEDIA_ACCEL hands the body off to the
+# front proxy: None, "nginx" (X-Accel-Redirect) or "sendfile" (X-Sendfile)
+MEDIA_ACCEL = None
+MEDIA_ACCEL_PREFIX = "/protected-media/"
+MEDIA_MAX_AGE = 60 * 60
+
+# Bulk follow/unfollow, see posts/follows.py
+FOLLOW_IMPORT_LIMIT = 1000
+FOLLOW_IMPORT_MAX_SIZE = 256 * 1024
+
+# Accounts are deleted by delete_accounts in batches, see posts/accounts.py
+ACCOUNT_DELETION_BATCH_SIZE = 200
+
+# Comments under a post, the rest is loaded by the "more" link
+COMMENTS_PAGE_SIZE = 20
+
+# Password hashing, see yatube/hashers.py and the bench_hashers command
+PASSWORD_HASHERS = [
+    "yatube.hashers.PBKDF2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+    "django.contrib.auth.hashers.Argon2PasswordHasher",
+    "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
+]
+PASSWORD_PBKDF2_ITERATIONS = 150000
+PASSWORD_HASH_WORKERS = 2
+PASSWORD_HASH_WAIT = 2
@@ -0,0 +1,190 @@
+"""
+Request tracing with nested timed spans.
+
+TracingMiddleware opens a trace for every request. SQL queries (through
+connection.execute_wrapper), template renders (including every
+{% include %}), cache calls and sorl-thumbnail work add spans to it.
+
+Only slow or failed requests are kept (tail sampling): when a request
+took TRACING_SLOW_MS or more, or ended with a 5xx or an exception, the
+trace is appended as one JSON line to TRACING_FILE.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import got_request_exception
+from django.db import connections
+
+CACHE_METHODS = ("get", "set", "add", "delete", "get_many", "set_many",
+                 "delete_many", "incr", "decr", "touch")
+
+_local = threading.local()
+_write_lock = threading.Lock()
+_installed = False
+
+
+class Trace:
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.start = time.perf_counter()
+        self.spans = []
+        self.stack = []
+        self.dropped = 0
+        self.error = None
+
+
+def current_trace():
+    return getattr(_local, "trace", None)
+
+
+@contextmanager
+def span(kind, name):
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+    if len(trace.spans) >= settings.TRACING_MAX_SPANS:
+        trace.dropped += 1
+        yield
+        return
+    record = {
+        "id": len(trace.spans),
+        "parent": trace.stack[-1]["id"] if trace.stack else None,
+        "kind": kind,
+        "name": name,
+        # time of nested spans of the same kind is already counted
+        "outer": all(s["kind"] != kind for s in trace.stack),
+    }
+    trace.spans.append(record)
+    trace.stack.append(record)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.stack.pop()
+        record["start_ms"] = round((start - trace.start) * 1000, 3)
+        record["duration_ms"] = round((time.perf_counter() - start) * 1000, 3)
+
+
+def traced(kind, name_of):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if current_trace() is None:
+                return func(*args, **kwargs)
+            with span(kind, name_of(*args, **kwargs)):
+                return func(*args, **kwargs)
+        wrapper.__traced__ = True
+        return wrapper
+    return decorator
+
+
+def patch(cls, method, kind, name_of):
+    func = getattr(cls, method)
+    if not getattr(func, "__traced__", False):
+        setattr(cls, method, traced(kind, name_of)(func))
+
+
+def install():
+    """Wrap template, cache and thumbnail code, once per process."""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+
+    from django.template.base import Template
+    patch(Template, "render", "template",
+          lambda template, context: template.name or "<string>")
+
+    for alias in settings.CACHES:
+        backend = type(caches[alias])
+        for method in CACHE_METHODS:
+            patch(backend, method, "cache", cache_span_name(method))
+
+    from sorl.thumbnail.base import ThumbnailBackend
+    patch(ThumbnailBackend, "get_thumbnail", "thumbnail",
+          lambda backend, file_, geometry_string, **options:
+          f"{geometry_string} {getattr(file_, 'name', file_)}")
+
+    got_request_exception.connect(record_exception)
+
+
+def cache_span_name(method):
+    def name_of(cache, *args, **kwargs):
+        return f"{method} {str(args[0])[:100]}" if args else method
+    return name_of
+
+
+def record_exception(sender, request=None, **kwargs):
+    trace = current_trace()
+    if trace is not None:
+        trace.error = repr(sys.exc_info()[1])
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    with span("db", sql[:200]):
+        return execute(sql, params, many, context)
+
+
+def summary(trace):
+    totals = {}
+    for record in trace.spans:
+        if record["outer"] and "duration_ms" in record:
+            kind = totals.setdefault(record["kind"], {"count": 0, "ms": 0})
+            kind["count"] += 1
+            kind["ms"] = round(kind["ms"] + record["duration_ms"], 3)
+    return totals
+
+
+def export(record):
+    path = settings.TRACING_FILE
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    with _write_lock, open(path, "a", encoding="utf-8") as f:
+        f.write(line)
+
+
+class TracingMiddleware:
+    def __init__(self, get_response):
+        if not settings.TRACING_ENABLED:
+            raise MiddlewareNotUsed
+        install()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        trace = _local.trace = Trace()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(execute_wrapper))
+                response = self.get_response(request)
+        finally:
+            _local.trace = None
+        duration = (time.perf_counter() - trace.start) * 1000
+        if (trace.error or response.status_code >= 500
+                or duration >= settings.TRACING_SLOW_MS):
+            match = request.resolver_match
+            export({
+                "trace_id": trace.id,
+                "time": time.time(),
+                "method": request.method,
+                "path": request.get_full_path(),
+                "view": match.view_name if match else None,
+                "status": response.status_code,
+                "error": trace.error,
+                "duration_ms": round(duration, 3),
+                "summary": summary(trace),
+                "dropped_spans": trace.dropped,
+                "spans": trace.spans,
+            })
+        return response
@@ -20,8 +20,11 @@ from django.contrib import admin
 from django.contrib.flatpages import views
 from django.urls import include, path
 
+from posts import sitemaps
 from posts import views as posts_views
 
+from . import media
+
 handler404 = "posts.views.page_not_found"  # noqa
 handler500 = "posts.views.server_error"  # noqa
 
@@ -32,6 +35,10 @@ urlpatterns = [
     path("auth/", include("django.contrib.auth.urls")),
     path('404/', posts_views.page_not_found, ),
     path('500/', posts_views.server_error),
+    path('sitemap.xml', sitemaps.index, name='sitemap'),
+    path('sitemap-<section>.xml', sitemaps.section, name='sitemap_section'),
+    path(settings.MEDIA_URL.lstrip('/') + '<path:path>', media.serve,
+         name='media'),
 ]
 
 urlpatterns += [
@@ -47,5 +54,4 @@ urlpatterns += [
 ]
 
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
\ No newline at end of file